@@ -9,12 +9,98 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 ENGINEERS_CHAT_ID = os.getenv("ENGINEERS_CHAT_ID")
 GSHEETS_TABLE_NAME = os.getenv("GSHEETS_TABLE_NAME")
 MENTION_ON_NEW_REQUEST = os.getenv("MENTION_ON_NEW_REQUEST")
+# Telegram ID администраторов через запятую; если не заданы, админами считаются инженеры
+ADMIN_IDS = [int(i) for i in os.getenv("ADMIN_IDS", "").split(",") if i.strip()]
 
 # --- Статические настройки ---
 GSHEETS_CREDENTIALS_FILE = "credentials.json"
-SHEET_NAMES = {"requests": "Заявки", "engineers": "Инженеры", "content": "Экспонаты"}
+SHEET_NAMES = {
+    "requests": "Заявки",
+    "engineers": "Инженеры",
+    "content": "Экспонаты",
+    "archive": "Архив",
+}
+# Завершенные заявки старше стольких дней переносятся с листа «Заявки» на
+# лист «Архив», чтобы лист заявок оставался небольшим; 0 — не переносить
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+# Как часто (в секундах) запускать перенос
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "86400"))
+
+# --- Локальные данные бота ---
+DATA_DIR = os.getenv("DATA_DIR", "data")
+REQUEST_ID_FILE = os.path.join(DATA_DIR, "last_request_id")
+PERSISTENCE_FILE = os.path.join(DATA_DIR, "bot_data.sqlite3")
+# Журнал изменений заявок; в таблицу они переносятся в фоне раз в
+# REQUEST_JOURNAL_SYNC_INTERVAL секунд
+REQUEST_JOURNAL_FILE = os.path.join(DATA_DIR, "requests.journal")
+REQUEST_JOURNAL_SYNC_INTERVAL = float(os.getenv("REQUEST_JOURNAL_SYNC_INTERVAL", "2"))
+# Через сколько секунд без переноса в таблицу /readyz считает бота неготовым;
+# 0 — не проверять (без таблицы бот продолжает работать на журнале)
+REQUEST_JOURNAL_MAX_LAG = float(os.getenv("REQUEST_JOURNAL_MAX_LAG", "0"))
+# Файл PicklePersistence прежних версий; переносится в SQLite при первом запуске
+LEGACY_PICKLE_FILE = "bot_data.pickle"
+# Несколько реплик бота с общим data/ (только в режиме webhook): данные
+# пишутся после каждого апдейта, диалоги сверяются с хранилищем
+SHARED_STATE = os.getenv("SHARED_STATE", "0").lower() in ("1", "true", "yes")
+# Сколько секунд ждать блокировку взятия заявки и через сколько она истекает,
+# если реплика упала, не отпустив ее
+SHARED_LOCK_TIMEOUT = float(os.getenv("SHARED_LOCK_TIMEOUT", "10"))
+SHARED_LOCK_TTL = float(os.getenv("SHARED_LOCK_TTL", "30"))
+# Как часто (в секундах) сверять кэш заявок с таблицей; с несколькими
+# репликами стоит уменьшить, чтобы списки заявок быстрее видели чужие изменения
+REQUESTS_RECONCILE_INTERVAL = int(os.getenv("REQUESTS_RECONCILE_INTERVAL", "900"))
+# Сколько дней хранить данные о заявке, к которой бот больше не обращался
+REQUEST_STATE_TTL_DAYS = int(os.getenv("REQUEST_STATE_TTL_DAYS", "14"))
+
+# --- Источник данных: "gspread" (Google Sheets) или "fake" (таблица в памяти) ---
+SHEETS_BACKEND = os.getenv("SHEETS_BACKEND", "gspread")
+# Для "fake": JSON-файл с листами {"Заявки": [[...], ...]}, задержка каждого
+# запроса в секундах и доля запросов, завершающихся ошибкой квоты (429)
+SHEETS_FAKE_DATA = os.getenv("SHEETS_FAKE_DATA")
+SHEETS_FAKE_LATENCY = float(os.getenv("SHEETS_FAKE_LATENCY", "0"))
+SHEETS_FAKE_QUOTA_ERROR_RATE = float(os.getenv("SHEETS_FAKE_QUOTA_ERROR_RATE", "0"))
+
+# --- Доступ к Google Sheets из асинхронных обработчиков ---
+# Сколько запросов к таблице может выполняться одновременно
+SHEETS_MAX_CONCURRENCY = int(os.getenv("SHEETS_MAX_CONCURRENCY", "4"))
+# Сколько секунд ждать ответа Google, прежде чем считать операцию неудачной
+SHEETS_TIMEOUT = float(os.getenv("SHEETS_TIMEOUT", "30"))
+# Квоты Google Sheets API на чтение и запись в минуту (по умолчанию — лимит
+# на одного пользователя) и сколько секунд повторять запрос после ошибки 429
+SHEETS_READ_QUOTA_PER_MINUTE = int(os.getenv("SHEETS_READ_QUOTA_PER_MINUTE", "60"))
+SHEETS_WRITE_QUOTA_PER_MINUTE = int(os.getenv("SHEETS_WRITE_QUOTA_PER_MINUTE", "60"))
+SHEETS_RETRY_DEADLINE = float(os.getenv("SHEETS_RETRY_DEADLINE", "20"))
+# Если таблица недоступна, подключение повторяется с нарастающей задержкой,
+# но не реже раза в столько секунд; до тех пор заявки копятся в журнале
+SHEETS_RECONNECT_INTERVAL = float(os.getenv("SHEETS_RECONNECT_INTERVAL", "30"))
+# Как часто (в секундах) фоновая задача проверяет подключение и срок токена
+SHEETS_KEEPALIVE_INTERVAL = float(os.getenv("SHEETS_KEEPALIVE_INTERVAL", "60"))
+
+# --- Метрики Prometheus: http://METRICS_HOST:METRICS_PORT/metrics, 0 — выключены ---
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# --- Получение апдейтов: "polling" или "webhook" ---
+UPDATES_MODE = os.getenv("UPDATES_MODE", "polling")
+# Для webhook: адрес и порт, которые слушает бот, путь вебхука и публичный
+# адрес (https://bot.example.com), по которому Telegram достучится до прокси
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+# Сертификат и ключ — только если TLS не завершается на прокси перед ботом
+WEBHOOK_TLS_CERT = os.getenv("WEBHOOK_TLS_CERT")
+WEBHOOK_TLS_KEY = os.getenv("WEBHOOK_TLS_KEY")
 
 if not all([BOT_TOKEN, ENGINEERS_CHAT_ID, GSHEETS_TABLE_NAME]):
     raise ValueError(
         "Необходимо задать все обязательные переменные окружения: BOT_TOKEN, ENGINEERS_CHAT_ID, GSHEETS_TABLE_NAME"
     )
+if UPDATES_MODE not in ("polling", "webhook"):
+    raise ValueError("UPDATES_MODE должен быть 'polling' или 'webhook'")
+if UPDATES_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError("Для UPDATES_MODE=webhook необходимо задать WEBHOOK_URL")
+if SHARED_STATE and UPDATES_MODE != "webhook":
+    raise ValueError("SHARED_STATE предназначен для нескольких реплик и требует UPDATES_MODE=webhook")
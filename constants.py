@@ -3,11 +3,14 @@ SELECTING_EXHIBIT, SELECTING_PROBLEM, TYPING_PROBLEM, SUBMITTING, AWAITING_COMME
 )
 CB_NEW_REQUEST = "new_request"
 CB_EXHIBIT_PREFIX = "exh_"
+CB_EXHIBIT_PAGE_PREFIX = "exhp_"
 CB_PROBLEM_PREFIX = "prb_"
 CB_CLAIM_PREFIX = "claim_"
 CB_COMPLETE_PREFIX = "complete_"
 CB_COMPLETE_REBOOT = "complete_reboot_"
 CB_COMPLETE_OTHER = "complete_other_"
 CB_CUSTOM_PROBLEM = "custom_problem"
-CB_BACK_TO_EXHIBIT = "back_to_exhibit"
 CB_CANCEL = "cancel"
+CB_LIST_PAGE_PREFIX = "lpage_"
+CB_LIST_CLAIM_PREFIX = "lclaim_"
+CB_MY_REQUESTS_PAGE_PREFIX = "myreq_"
@@ -0,0 +1,141 @@
+"""Клавиатуры выбора экспоната и проблемы для диалога создания заявки.
+
+Клавиатуры собираются один раз при обновлении листа «Экспонаты», а не на
+каждое нажатие. В callback_data вместо названия лежит короткий id: кириллица
+занимает по два байта, и длинные названия не помещались в 64 байта, которые
+Telegram разрешает для callback_data. id — хэш названия, поэтому кнопки в уже
+отправленных сообщениях остаются рабочими после обновления листа, перезапуска
+и на другой реплике, пока экспонат или проблему не переименовали.
+"""
+
+import hashlib
+import threading
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import constants as c
+
+EXHIBITS_PER_PAGE = 8
+# 10 шестнадцатеричных знаков: совпадение на сотнях экспонатов практически исключено
+ID_LENGTH = 10
+
+
+def _short_id(*parts) -> str:
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()[:ID_LENGTH]
+
+
+def exhibit_callback(exhibit: str) -> str:
+    return f"{c.CB_EXHIBIT_PREFIX}{_short_id(exhibit)}"
+
+
+def problem_callback(exhibit: str, problem: str) -> str:
+    # В id проблемы входит экспонат: одинаковые проблемы у разных экспонатов
+    # различаются, и по нажатию сразу понятно, к какому экспонату она относится
+    return f"{c.CB_PROBLEM_PREFIX}{_short_id(exhibit, problem)}"
+
+
+class ContentCatalog:
+    def __init__(self, content):
+        self.content = content
+        self._exhibits = {}
+        self._problems = {}
+        self._problem_keyboards = {}
+        exhibits = list(content)
+        self.pages = -(-len(exhibits) // EXHIBITS_PER_PAGE)
+        self._exhibit_pages = [
+            self._exhibit_keyboard(
+                exhibits[page * EXHIBITS_PER_PAGE : (page + 1) * EXHIBITS_PER_PAGE], page
+            )
+            for page in range(self.pages)
+        ]
+        for index, exhibit in enumerate(exhibits):
+            self._exhibits[_short_id(exhibit)] = exhibit
+            self._problem_keyboards[exhibit] = self._problem_keyboard(
+                exhibit, content[exhibit], index // EXHIBITS_PER_PAGE
+            )
+
+    def exhibit_page(self, page: int):
+        """Клавиатура страницы экспонатов; page приводится к допустимому диапазону."""
+        if not self._exhibit_pages:
+            return None
+        return self._exhibit_pages[min(max(page, 0), self.pages - 1)]
+
+    def exhibit(self, exhibit_id: str):
+        """Название экспоната по id из callback_data или None."""
+        return self._exhibits.get(exhibit_id)
+
+    def problem_keyboard(self, exhibit: str):
+        return self._problem_keyboards.get(exhibit)
+
+    def problem(self, problem_id: str):
+        """Пара (экспонат, проблема) по id из callback_data или None."""
+        return self._problems.get(problem_id)
+
+    def _exhibit_keyboard(self, exhibits, page):
+        keyboard = [
+            [InlineKeyboardButton(exhibit, callback_data=exhibit_callback(exhibit))]
+            for exhibit in exhibits
+        ]
+        navigation = []
+        if page > 0:
+            navigation.append(
+                InlineKeyboardButton(
+                    "⬅️ Назад", callback_data=f"{c.CB_EXHIBIT_PAGE_PREFIX}{page - 1}"
+                )
+            )
+        if page < self.pages - 1:
+            navigation.append(
+                InlineKeyboardButton(
+                    "Вперед ➡️", callback_data=f"{c.CB_EXHIBIT_PAGE_PREFIX}{page + 1}"
+                )
+            )
+        if navigation:
+            keyboard.append(navigation)
+        return InlineKeyboardMarkup(keyboard)
+
+    def _problem_keyboard(self, exhibit, problems, page):
+        keyboard = []
+        for problem in problems:
+            self._problems[_short_id(exhibit, problem)] = (exhibit, problem)
+            keyboard.append(
+                [
+                    InlineKeyboardButton(
+                        problem, callback_data=problem_callback(exhibit, problem)
+                    )
+                ]
+            )
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    "Другое (описать текстом)", callback_data=c.CB_CUSTOM_PROBLEM
+                )
+            ]
+        )
+        # Возвращаемся на ту страницу списка, где был выбранный экспонат
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    "⬅️ Назад к экспонатам",
+                    callback_data=f"{c.CB_EXHIBIT_PAGE_PREFIX}{page}",
+                )
+            ]
+        )
+        return InlineKeyboardMarkup(keyboard)
+
+
+_lock = threading.Lock()
+_catalog = None
+
+
+def get(content) -> ContentCatalog:
+    """Каталог для bot_data["content"]; собирается заново, только если он изменился."""
+    global _catalog
+    with _lock:
+        if _catalog is None or (
+            _catalog.content is not content and _catalog.content != content
+        ):
+            _catalog = ContentCatalog(content)
+        # С общим хранилищем bot_data перечитывается, и тот же content
+        # приходит новым объектом — сравниваем дальше уже по ссылке
+        _catalog.content = content
+        return _catalog
@@ -1,44 +1,320 @@
 import logging
 
-from telegram import Update
-from telegram.ext import CommandHandler, ContextTypes
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import CallbackQueryHandler, CommandHandler, ContextTypes
 
-import sheets
+import constants as c
+import content_catalog
+import metrics
+import reminders
+import request_state
+import sheets_async
+from config import ARCHIVE_AFTER_DAYS
+from shared_state import hold_lock
 
-from .helpers import escape_markdown, get_user_mention
+from .helpers import (
+    MAX_PROBLEM_LENGTH,
+    delete_tracked_messages,
+    escape_markdown,
+    escape_truncated,
+    get_user_mention,
+    is_admin,
+    is_engineer,
+    split_message,
+)
 
 logger = logging.getLogger(__name__)
 
 
-async def update_data_from_sheets(context: ContextTypes.DEFAULT_TYPE):
-    logger.info("Обновление данных из Google Sheets...")
-    context.bot_data["engineers"] = sheets.get_engineers()
-    context.bot_data["content"] = sheets.get_content()
+def _apply_reference_data(context: ContextTypes.DEFAULT_TYPE, engineers, content):
+    # Пересобираем bot_data только при реальных изменениях, чтобы не вызывать
+    # лишнюю перезапись хранилища
+    if context.bot_data.get("engineers") != engineers:
+        context.bot_data["engineers"] = engineers
+    if context.bot_data.get("content") != content:
+        context.bot_data["content"] = content
+    # Клавиатуры выбора экспоната собираются сразу, а не при первом нажатии
+    content_catalog.get(context.bot_data["content"])
     logger.info(
-        f"Данные обновлены. Инженеров: {len(context.bot_data.get('engineers', []))}, Экспонатов: {len(context.bot_data.get('content', {}))}"
+        f"Данные обновлены. Инженеров: {len(engineers)}, Экспонатов: {len(content)}"
+    )
+
+
+@metrics.instrument_job
+async def update_data_from_sheets(context: ContextTypes.DEFAULT_TYPE):
+    data = await sheets_async.fetch_reference_data()
+    if data is None:
+        logger.debug("Справочные листы не изменились.")
+        return
+    _apply_reference_data(context, *data)
+
+
+@metrics.instrument_handler
+async def reload_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.message.from_user.id, context):
+        await update.message.reply_text("Эта команда доступна только администраторам.")
+        return
+    data = await sheets_async.fetch_reference_data(
+        force=True, priority=sheets_async.INTERACTIVE
+    )
+    if data is None:
+        await update.message.reply_text("Не удалось загрузить данные из таблицы.")
+        return
+    _apply_reference_data(context, *data)
+    await sheets_async.reload_requests(priority=sheets_async.INTERACTIVE)
+    engineers, content = data
+    await update.message.reply_text(
+        f"🔄 Данные перезагружены. Инженеров: {len(engineers)}, экспонатов: {len(content)}."
+    )
+
+
+@metrics.instrument_job
+async def reconcile_requests(context: ContextTypes.DEFAULT_TYPE):
+    if await sheets_async.reload_requests():
+        logger.info("Кэш заявок сверен с Google Sheets.")
+
+
+@metrics.instrument_job
+async def maintain_sheets_connection(context: ContextTypes.DEFAULT_TYPE):
+    """Подключиться к Google Sheets, если связи нет, и заранее обновить токен."""
+    await sheets_async.maintain_connection()
+
+
+@metrics.instrument_job
+async def sync_request_journal(context: ContextTypes.DEFAULT_TYPE):
+    """Перенести в таблицу изменения заявок, записанные в журнал."""
+    replicated = await sheets_async.sync_journal()
+    if replicated:
+        logger.debug(f"В таблицу перенесено событий журнала: {replicated}")
+
+
+@metrics.instrument_job
+async def sweep_request_state(context: ContextTypes.DEFAULT_TYPE):
+    """Удалить из bot_data состояние закрытых и давно забытых заявок."""
+    removed = 0
+    for request_id, entry in request_state.items(context.bot_data):
+        request = await sheets_async.get_request(
+            request_id, priority=sheets_async.BACKGROUND
+        )
+        closed = request is not None and request.get("Статус") == "Завершена"
+        if not closed and not request_state.is_expired(entry):
+            continue
+        if closed and entry["claim"] is None:
+            # Заявку закрыли в обход бота — в чате инженеров осталась
+            # неактуальная кнопка «Взять в работу»
+            await delete_tracked_messages(context, request_id)
+        reminders.cleanup_request_tracking(context, request_id)
+        request_state.forget(context.bot_data, request_id)
+        removed += 1
+    if removed:
+        logger.info(f"Удалено устаревших записей о заявках: {removed}")
+
+
+# Блокировка переноса в архив: удаление строк двумя репликами сразу сдвинет
+# нумерацию друг другу, поэтому она живет дольше самого долгого переноса
+ARCHIVE_LOCK_TTL = 3600
+# Через сколько секунд продолжить перенос, если за раз перенесено не все
+ARCHIVE_CONTINUE_DELAY = 60
+
+
+@metrics.instrument_job
+async def archive_requests(context: ContextTypes.DEFAULT_TYPE):
+    """Перенести давно завершенные заявки с листа «Заявки» на лист «Архив»."""
+    async with hold_lock(
+        context.application, "archive_requests", timeout=0, ttl=ARCHIVE_LOCK_TTL
+    ) as locked:
+        if not locked:
+            logger.info("Перенос заявок в архив уже выполняет другая реплика.")
+            return
+        result = await sheets_async.archive_completed_requests(ARCHIVE_AFTER_DAYS)
+    if result is None:
+        return
+    moved, has_more = result
+    if moved:
+        logger.info(f"Перенесено в архив заявок: {moved}")
+    if has_more:
+        context.job_queue.run_once(archive_requests, when=ARCHIVE_CONTINUE_DELAY)
+
+
+# Сколько последних закрытых заявок показывать вместе с открытыми
+MY_REQUESTS_RECENT_CLOSED = 5
+MY_REQUESTS_HISTORY_PAGE_SIZE = 5
+STATUS_ICONS = {"Новая": "‼️", "В работе": "⚙️", "Завершена": "✅"}
+
+
+def _format_my_request(req) -> str:
+    # Обрезается уже экранированный текст: страница истории из
+    # MY_REQUESTS_HISTORY_PAGE_SIZE заявок уходит одним сообщением
+    problem = escape_truncated(req.get("Проблема", ""), MAX_PROBLEM_LENGTH)
+    status_icon = STATUS_ICONS.get(req["Статус"], "❓")
+    return (
+        f"{status_icon} *\\#{escape_markdown(req['id'])}* \\({escape_markdown(req['Статус'])}\\)\n"
+        f"   *Экспонат:* {escape_markdown(req['Экспонат'])}\n"
+        f"   *Проблема:* {problem}"
     )
 
 
+def _split_my_requests(my_requests):
+    """Разделить заявки на открытые + недавние закрытые и более раннюю историю."""
+    closed = [req for req in my_requests if req["Статус"] == "Завершена"]
+    open_requests = [req for req in my_requests if req["Статус"] != "Завершена"]
+    recent = closed[-MY_REQUESTS_RECENT_CLOSED:] if MY_REQUESTS_RECENT_CLOSED else []
+    history = closed[: len(closed) - len(recent)]
+    # История листается от новых заявок к старым
+    return open_requests + recent, history[::-1]
+
+
+def _history_keyboard(page: int, total: int):
+    pages = -(-total // MY_REQUESTS_HISTORY_PAGE_SIZE)
+    buttons = []
+    if page > 0:
+        buttons.append(
+            InlineKeyboardButton(
+                "⬅️ Новее", callback_data=f"{c.CB_MY_REQUESTS_PAGE_PREFIX}{page - 1}"
+            )
+        )
+    if page < pages - 1:
+        buttons.append(
+            InlineKeyboardButton(
+                "Старше ➡️", callback_data=f"{c.CB_MY_REQUESTS_PAGE_PREFIX}{page + 1}"
+            )
+        )
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+@metrics.instrument_handler
 async def show_my_requests(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.message.from_user
     user_mention = get_user_mention(user)
-    my_requests = sheets.get_requests_by_demonstrator(user_mention)
+    my_requests = await sheets_async.get_requests_by_demonstrator(user_mention)
     if not my_requests:
         await update.message.reply_text("У вас нет созданных заявок.")
         return
 
-    text = "🔍 *Ваши заявки:*\n\n"
-    for req in my_requests:
-        status_icon = {"Новая": "‼️", "В работе": "⚙️", "Завершена": "✅"}.get(
-            req["Статус"], "❓"
+    current, history = _split_my_requests(my_requests)
+    blocks = ["🔍 *Ваши заявки:*"] + [_format_my_request(req) for req in current]
+    chunks = split_message(blocks)
+    for chunk in chunks[:-1]:
+        await update.message.reply_text(chunk, parse_mode="MarkdownV2")
+
+    reply_markup = None
+    if history:
+        reply_markup = InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        f"📜 Более ранние заявки ({len(history)})",
+                        callback_data=f"{c.CB_MY_REQUESTS_PAGE_PREFIX}0",
+                    )
+                ]
+            ]
+        )
+    await update.message.reply_text(
+        chunks[-1], reply_markup=reply_markup, parse_mode="MarkdownV2"
+    )
+
+
+@metrics.instrument_handler
+async def show_my_requests_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    page = int(query.data[len(c.CB_MY_REQUESTS_PAGE_PREFIX) :])
+    user_mention = get_user_mention(query.from_user)
+    my_requests = await sheets_async.get_requests_by_demonstrator(user_mention)
+    _, history = _split_my_requests(my_requests)
+    if not history:
+        await query.edit_message_text("Более ранних заявок нет.")
+        return
+
+    pages = -(-len(history) // MY_REQUESTS_HISTORY_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    start = page * MY_REQUESTS_HISTORY_PAGE_SIZE
+    blocks = [f"📜 *История заявок, стр\\. {page + 1}/{pages}:*"] + [
+        _format_my_request(req)
+        for req in history[start : start + MY_REQUESTS_HISTORY_PAGE_SIZE]
+    ]
+    await query.edit_message_text(
+        "\n\n".join(blocks),
+        reply_markup=_history_keyboard(page, len(history)),
+        parse_mode="MarkdownV2",
+    )
+
+
+# Сколько экспонатов и инженеров показывать в /stats
+STATS_TOP = 10
+
+
+def _format_duration(seconds) -> str:
+    if seconds is None:
+        return "—"
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes} мин"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours} ч {minutes} мин" if minutes else f"{hours} ч"
+    days, hours = divmod(hours, 24)
+    return f"{days} дн {hours} ч" if hours else f"{days} дн"
+
+
+def _format_durations(title, summary) -> str:
+    if not summary["count"]:
+        return escape_markdown(f"   {title}: нет данных")
+    return escape_markdown(
+        f"   {title}: медиана {_format_duration(summary['p50'])}, "
+        f"90% — до {_format_duration(summary['p90'])}, "
+        f"в среднем {_format_duration(summary['mean'])} (заявок: {summary['count']})"
+    )
+
+
+def _format_stats(stats):
+    blocks = ["📊 *Статистика заявок*", "*Экспонаты с наибольшим числом заявок:*"]
+    exhibits = sorted(
+        stats["exhibits"].items(), key=lambda item: item[1]["total"], reverse=True
+    )
+    for name, entry in exhibits[:STATS_TOP]:
+        blocks.append(
+            f"🔧 *{escape_markdown(name)}* — заявок: {entry['total']}, "
+            f"открыто: {entry['open']}\n"
+            f"{_format_durations('До взятия', entry['claim'])}\n"
+            f"{_format_durations('Устранение', entry['resolve'])}"
         )
-        text += (
-            f"{status_icon} *\\#{escape_markdown(req['id'])}* \\({escape_markdown(req['Статус'])}\\)\n"
-            f"   *Экспонат:* {escape_markdown(req['Экспонат'])}\n"
-            f"   *Проблема:* {escape_markdown(req['Проблема'])}\n\n"
+
+    blocks.append("*Нагрузка инженеров \\(в работе / завершено\\):*")
+    engineers = sorted(
+        (entry for key, entry in stats["engineers"].items() if key != "—"),
+        key=lambda entry: (entry["in_progress"], entry["done"]),
+        reverse=True,
+    )
+    for entry in engineers[:STATS_TOP]:
+        blocks.append(
+            f"👷‍♂️ *{escape_markdown(entry['name'])}* — "
+            f"{entry['in_progress']} / {entry['done']}\n"
+            f"{_format_durations('До взятия', entry['claim'])}\n"
+            f"{_format_durations('Устранение', entry['resolve'])}"
         )
+    return blocks
+
 
-    await update.message.reply_text(text, parse_mode="MarkdownV2")
+@metrics.instrument_handler
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.message.from_user.id
+    if not (is_admin(user_id, context) or is_engineer(user_id, context)):
+        await update.message.reply_text(
+            "Эта команда доступна только инженерам и администраторам."
+        )
+        return
+    stats = await sheets_async.get_stats()
+    if stats is None:
+        await update.message.reply_text("Не удалось загрузить заявки из таблицы.")
+        return
+    for chunk in split_message(_format_stats(stats)):
+        await update.message.reply_text(chunk, parse_mode="MarkdownV2")
 
 
 my_requests_handler = CommandHandler("myrequests", show_my_requests)
+my_requests_history_handler = CallbackQueryHandler(
+    show_my_requests_history, pattern=f"^{c.CB_MY_REQUESTS_PAGE_PREFIX}"
+)
+reload_handler = CommandHandler("reload", reload_data)
+stats_handler = CommandHandler("stats", show_stats)
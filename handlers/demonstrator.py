@@ -11,14 +11,19 @@ from telegram.ext import (
 )
 
 import constants as c
-import sheets
+import content_catalog
+import metrics
+import request_state
+import sheets_async
 from config import ENGINEERS_CHAT_ID, MENTION_ON_NEW_REQUEST
+from shared_state import SharedConversationHandler
 
 from . import helpers
 
 logger = logging.getLogger(__name__)
 
 
+@metrics.instrument_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     chat_type = update.message.chat.type
     if chat_type in [Chat.GROUP, Chat.SUPERGROUP]:
@@ -41,60 +46,63 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return c.SELECTING_EXHIBIT
 
 
-async def select_exhibit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    query = update.callback_query
-    await query.answer()
-    exhibits = context.bot_data.get("content", {}).keys()
-    if not exhibits:
+def _catalog(context: ContextTypes.DEFAULT_TYPE) -> content_catalog.ContentCatalog:
+    return content_catalog.get(context.bot_data.get("content", {}))
+
+
+async def _show_exhibits(query, context, page=0, notice="") -> int:
+    catalog = _catalog(context)
+    if not catalog.pages:
         await query.edit_message_text("Ошибка: не удалось загрузить список экспонатов.")
         return ConversationHandler.END
-    keyboard = [
-        [InlineKeyboardButton(exhibit, callback_data=f"{c.CB_EXHIBIT_PREFIX}{exhibit}")]
-        for exhibit in exhibits
-    ]
+    page = min(max(page, 0), catalog.pages - 1)
+    text = "Шаг 1: Выберите экспонат"
+    if catalog.pages > 1:
+        text += f" (стр. {page + 1}/{catalog.pages})"
     await query.edit_message_text(
-        text="Шаг 1: Выберите экспонат", reply_markup=InlineKeyboardMarkup(keyboard)
+        text=f"{notice}{text}", reply_markup=catalog.exhibit_page(page)
     )
     return c.SELECTING_PROBLEM
 
 
+@metrics.instrument_handler
+async def select_exhibit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    return await _show_exhibits(query, context)
+
+
+@metrics.instrument_handler
+async def show_exhibit_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    page = int(query.data[len(c.CB_EXHIBIT_PAGE_PREFIX) :])
+    return await _show_exhibits(query, context, page)
+
+
+@metrics.instrument_handler
 async def select_problem(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    exhibit_name = query.data.split(c.CB_EXHIBIT_PREFIX)[1]
+    catalog = _catalog(context)
+    key = query.data[len(c.CB_EXHIBIT_PREFIX) :]
+    exhibit_name = catalog.exhibit(key)
+    # Кнопки, отправленные до перехода на короткие id, несут само название
+    if exhibit_name is None and key in catalog.content:
+        exhibit_name = key
+    if exhibit_name is None:
+        return await _show_exhibits(
+            query, context, notice="Список экспонатов обновился.\n\n"
+        )
     context.user_data["exhibit"] = exhibit_name
-    problems = context.bot_data["content"].get(exhibit_name, [])
-    keyboard = [
-        [InlineKeyboardButton(p, callback_data=f"{c.CB_PROBLEM_PREFIX}{p}")]
-        for p in problems
-    ]
-    keyboard.append(
-        [
-            InlineKeyboardButton(
-                "Другое (описать текстом)", callback_data=c.CB_CUSTOM_PROBLEM
-            )
-        ]
-    )
-    keyboard.append(
-        [
-            InlineKeyboardButton(
-                "⬅️ Назад к экспонатам", callback_data=c.CB_BACK_TO_EXHIBIT
-            )
-        ]
-    )
     await query.edit_message_text(
         text=f"Экспонат: {exhibit_name}\n\nШаг 2: Опишите проблему",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=catalog.problem_keyboard(exhibit_name),
     )
     return c.SUBMITTING
 
 
-async def back_to_exhibit_selection(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
-) -> int:
-    return await select_exhibit(update, context)
-
-
+@metrics.instrument_handler
 async def custom_problem(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -104,6 +112,7 @@ async def custom_problem(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return c.TYPING_PROBLEM
 
 
+@metrics.instrument_handler
 async def submit_problem_text(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
@@ -112,16 +121,29 @@ async def submit_problem_text(
     return ConversationHandler.END
 
 
+@metrics.instrument_handler
 async def submit_problem_button(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
     query = update.callback_query
     await query.answer()
-    context.user_data["problem"] = query.data.split(c.CB_PROBLEM_PREFIX)[1]
+    catalog = _catalog(context)
+    key = query.data[len(c.CB_PROBLEM_PREFIX) :]
+    selected = catalog.problem(key)
+    if selected is not None:
+        context.user_data["exhibit"], context.user_data["problem"] = selected
+    elif key in catalog.content.get(context.user_data.get("exhibit"), []):
+        # Кнопка со старым форматом: в callback_data сам текст проблемы
+        context.user_data["problem"] = key
+    else:
+        return await _show_exhibits(
+            query, context, notice="Список проблем обновился.\n\n"
+        )
     await submit_request(query, context)
     return ConversationHandler.END
 
 
+@metrics.instrument_handler
 async def submit_request(source, context: ContextTypes.DEFAULT_TYPE):
     if isinstance(source, Update):
         user = source.message.from_user
@@ -133,7 +155,7 @@ async def submit_request(source, context: ContextTypes.DEFAULT_TYPE):
     exhibit_raw = context.user_data["exhibit"]
     problem_raw = context.user_data["problem"]
 
-    request_id = sheets.add_new_request(
+    request_id = await sheets_async.add_new_request(
         demonstrator_username_raw, exhibit_raw, problem_raw
     )
     if request_id is None:
@@ -146,7 +168,7 @@ async def submit_request(source, context: ContextTypes.DEFAULT_TYPE):
             await source.edit_message_text(error_text)
         return
 
-    context.bot_data[f"req_{request_id}_author"] = demonstrator_id
+    request_state.set_author(context.bot_data, request_id, demonstrator_id)
 
     text_for_engineers = (
         f"‼️ *Новая заявка \\#{helpers.escape_markdown(str(request_id))}* ‼️\n\n"
@@ -182,6 +204,7 @@ async def submit_request(source, context: ContextTypes.DEFAULT_TYPE):
         await source.edit_message_text(final_text)
 
 
+@metrics.instrument_handler
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     source = update.callback_query
     if source:
@@ -193,7 +216,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
-conv_handler = ConversationHandler(
+conv_handler = SharedConversationHandler(
     entry_points=[
         CommandHandler("start", start),
         CallbackQueryHandler(select_exhibit, pattern=f"^{c.CB_NEW_REQUEST}$"),
@@ -203,7 +226,10 @@ conv_handler = ConversationHandler(
             CallbackQueryHandler(select_exhibit, pattern=f"^{c.CB_NEW_REQUEST}$")
         ],
         c.SELECTING_PROBLEM: [
-            CallbackQueryHandler(select_problem, pattern=f"^{c.CB_EXHIBIT_PREFIX}")
+            CallbackQueryHandler(select_problem, pattern=f"^{c.CB_EXHIBIT_PREFIX}"),
+            CallbackQueryHandler(
+                show_exhibit_page, pattern=f"^{c.CB_EXHIBIT_PAGE_PREFIX}"
+            ),
         ],
         c.SUBMITTING: [
             CallbackQueryHandler(
@@ -211,7 +237,7 @@ conv_handler = ConversationHandler(
             ),
             CallbackQueryHandler(custom_problem, pattern=f"^{c.CB_CUSTOM_PROBLEM}$"),
             CallbackQueryHandler(
-                back_to_exhibit_selection, pattern=f"^{c.CB_BACK_TO_EXHIBIT}$"
+                show_exhibit_page, pattern=f"^{c.CB_EXHIBIT_PAGE_PREFIX}"
             ),
         ],
         c.TYPING_PROBLEM: [
@@ -224,4 +250,6 @@ conv_handler = ConversationHandler(
     ],
     per_user=True,
     per_message=False,
+    name="new_request",
+    persistent=True,
 )
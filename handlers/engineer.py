@@ -1,5 +1,4 @@
 import logging
-import re
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
@@ -12,9 +11,12 @@ from telegram.ext import (
 )
 
 import constants as c
+import metrics
 import reminders
-import sheets
+import request_state
+import sheets_async
 from config import ENGINEERS_CHAT_ID
+from shared_state import SharedConversationHandler
 
 from . import helpers
 
@@ -23,6 +25,7 @@ logger = logging.getLogger(__name__)
 # --- ДИАЛОГ ЗАВЕРШЕНИЯ ЗАЯВКИ ---
 
 
+@metrics.instrument_handler
 async def start_completion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -54,6 +57,7 @@ async def start_completion(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     return c.AWAITING_COMMENT
 
 
+@metrics.instrument_handler
 async def complete_with_reboot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -61,13 +65,14 @@ async def complete_with_reboot(update: Update, context: ContextTypes.DEFAULT_TYP
     request_id = str(query.data.split(c.CB_COMPLETE_REBOOT)[1])
     comment = "Перезагрузка"
 
-    if sheets.update_request_status(request_id, "Завершена", comment=comment):
+    if await sheets_async.update_request_status(
+        request_id, "Завершена", comment=comment
+    ):
         await query.edit_message_text(
             f"✅ Заявка #{request_id} успешно завершена с решением: Перезагрузка."
         )
 
-        all_requests = sheets.get_requests_by_status("Завершена")
-        req_data = next((r for r in all_requests if r["id"] == request_id), None)
+        req_data = await sheets_async.get_request(request_id)
 
         if req_data:
             final_text = (
@@ -79,7 +84,7 @@ async def complete_with_reboot(update: Update, context: ContextTypes.DEFAULT_TYP
                 chat_id=ENGINEERS_CHAT_ID, text=final_text, parse_mode="MarkdownV2"
             )
 
-        demonstrator_id = context.bot_data.get(f"req_{request_id}_author")
+        demonstrator_id = request_state.get_author(context.bot_data, request_id)
         if demonstrator_id:
             await context.bot.send_message(
                 chat_id=demonstrator_id,
@@ -87,11 +92,9 @@ async def complete_with_reboot(update: Update, context: ContextTypes.DEFAULT_TYP
                 parse_mode="MarkdownV2",
             )
 
-        if f"req_{request_id}_author" in context.bot_data:
-            del context.bot_data[f"req_{request_id}_author"]
-        
-        # Очищаем данные отслеживания напоминаний
+        # Очищаем данные отслеживания напоминаний и состояние заявки
         reminders.cleanup_request_tracking(context, request_id)
+        request_state.forget(context.bot_data, request_id)
     else:
         await query.edit_message_text("Не удалось обновить статус заявки в таблице.")
 
@@ -99,6 +102,7 @@ async def complete_with_reboot(update: Update, context: ContextTypes.DEFAULT_TYP
     return ConversationHandler.END
 
 
+@metrics.instrument_handler
 async def start_other_comment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -115,6 +119,7 @@ async def start_other_comment(update: Update, context: ContextTypes.DEFAULT_TYPE
     return c.AWAITING_OTHER_COMMENT
 
 
+@metrics.instrument_handler
 async def save_comment_and_complete(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> int:
@@ -128,13 +133,14 @@ async def save_comment_and_complete(
     # Добавляем префикс "Другое:" к комментарию
     comment = f"Другое: {user_comment}"
 
-    if sheets.update_request_status(request_id, "Завершена", comment=comment):
+    if await sheets_async.update_request_status(
+        request_id, "Завершена", comment=comment
+    ):
         await update.message.reply_text(
             f"✅ Заявка #{request_id} успешно завершена с вашим комментарием."
         )
 
-        all_requests = sheets.get_requests_by_status("Завершена")
-        req_data = next((r for r in all_requests if r["id"] == request_id), None)
+        req_data = await sheets_async.get_request(request_id)
 
         if req_data:
             final_text = (
@@ -146,7 +152,7 @@ async def save_comment_and_complete(
                 chat_id=ENGINEERS_CHAT_ID, text=final_text, parse_mode="MarkdownV2"
             )
 
-        demonstrator_id = context.bot_data.get(f"req_{request_id}_author")
+        demonstrator_id = request_state.get_author(context.bot_data, request_id)
         if demonstrator_id:
             await context.bot.send_message(
                 chat_id=demonstrator_id,
@@ -154,11 +160,9 @@ async def save_comment_and_complete(
                 parse_mode="MarkdownV2",
             )
 
-        if f"req_{request_id}_author" in context.bot_data:
-            del context.bot_data[f"req_{request_id}_author"]
-        
-        # Очищаем данные отслеживания напоминаний
+        # Очищаем данные отслеживания напоминаний и состояние заявки
         reminders.cleanup_request_tracking(context, request_id)
+        request_state.forget(context.bot_data, request_id)
     else:
         await update.message.reply_text("Не удалось обновить статус заявки в таблице.")
 
@@ -166,6 +170,7 @@ async def save_comment_and_complete(
     return ConversationHandler.END
 
 
+@metrics.instrument_handler
 async def cancel_completion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     request_id = context.user_data.get("completing_request_id")
     await update.message.reply_text(
@@ -178,61 +183,78 @@ async def cancel_completion(update: Update, context: ContextTypes.DEFAULT_TYPE)
 # --- ОСНОВНАЯ ЛОГИКА ---
 
 
-async def claim_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
+async def _try_claim(query, context: ContextTypes.DEFAULT_TYPE, request_id: str):
+    """Разыграть взятие заявки в памяти и сразу ответить на нажатие кнопки.
+
+    Возвращает упоминание инженера при успехе, False — если заявку уже взяли,
+    None — при отказе или ошибке. В журнал взятие записывает _commit_claim().
+    """
     user = query.from_user
 
     if not helpers.is_engineer(user.id, context):
         await query.answer(
             "Эту кнопку могут нажимать только инженеры.", show_alert=True
         )
-        return
-
-    request_id = str(query.data.split(c.CB_CLAIM_PREFIX)[1])
-
-    if not sheets.is_request_new(request_id):
-        await query.answer("Эта заявка уже была взята в работу!", show_alert=True)
-        try:
-            await query.edit_message_reply_markup(reply_markup=None)
-        except Exception:
-            pass
-        return
+        return None
 
     engineer_username_raw = helpers.get_user_mention(user)
-    engineer_name_raw = sheets.get_engineer_name_by_id(user.id) or engineer_username_raw
-
-    if not sheets.update_request_status(
-        request_id, "В работе", engineer_username_raw, engineer_name_raw
-    ):
-        await query.answer(
-            "Произошла ошибка при обновлении статуса в таблице.", show_alert=True
-        )
-        return
-
-    # Начинаем отслеживание времени для напоминаний
-    reminders.track_request_claim_time(context, request_id, user.id)
+    claimed = await sheets_async.try_claim(request_id, user.id, engineer_username_raw)
+    if claimed is None:
+        await query.answer("Заявка не найдена в таблице.", show_alert=True)
+        return None
+    if not claimed:
+        await query.answer("Эта заявка уже была взята в работу!", show_alert=True)
+        return False
 
     await query.answer(
         "Вы взяли заявку в работу! Карточка задачи отправлена вам в личные сообщения."
     )
+    return engineer_username_raw
 
-    original_text_v2 = query.message.text_markdown_v2
+
+async def _commit_claim(
+    query, context: ContextTypes.DEFAULT_TYPE, request_id, engineer_username_raw
+):
+    """Записать в журнал взятие, выигранное в _try_claim().
+
+    Возвращает True, если взятие сохранено, и имя взявшего инженера, если
+    заявку раньше взяли через другую реплику. Если записать не удалось,
+    взятие откатывается в памяти и возвращается None. В обоих случаях
+    инженер получает сообщение об отмене.
+    """
+    user = query.from_user
+    # Журнал дочитывает чужие события под блокировкой, общей для всех реплик,
+    # поэтому заявку, взятую другой репликой, write_claim не запишет
+    result = await sheets_async.write_claim(request_id, user.id, engineer_username_raw)
+    if result:
+        # Начинаем отслеживание времени для напоминаний
+        reminders.track_request_claim_time(context, request_id, user.id)
+        return True
+    if result is None:
+        sheets_async.release_claim(request_id, engineer_username_raw)
+
+    if result is False:
+        req = await sheets_async.get_request(request_id) or {}
+        result = req.get("engineer_username") or "другой инженер"
+        text = f"Заявку #{request_id} уже взял в работу {result}."
+    else:
+        text = (
+            f"Не удалось сохранить взятие заявки #{request_id}. "
+            f"Заявка снова свободна, попробуйте взять ее еще раз."
+        )
+    logger.warning(f"Взятие заявки {request_id} инженером {user.id} отменено")
     try:
-        header, body = original_text_v2.split("\n\n", 1)
-    except ValueError:
-        header = ""
-        body = original_text_v2
+        await context.bot.send_message(chat_id=user.id, text=text)
+    except Exception as e:
+        logger.error(f"Не удалось отправить ЛС инженеру {user.id}: {e}")
+        await query.message.reply_text(f"{engineer_username_raw}: {text}")
+    return result
 
-    new_header_in_group = "⚙️ *Заявка в работе*"
-    new_text_in_group = (
-        f"{new_header_in_group}\n\n"
-        f"{body}\n\n"
-        f"👷‍♂️ *Взял в работу:* {helpers.escape_markdown(engineer_username_raw)}"
-    )
-    await query.edit_message_text(
-        text=new_text_in_group, reply_markup=None, parse_mode="MarkdownV2"
-    )
 
+async def _notify_claimed(
+    query, context: ContextTypes.DEFAULT_TYPE, request_id, engineer_username_raw, body
+):
+    user = query.from_user
     text_for_pm = (
         f"Вы взяли в работу заявку \\#{helpers.escape_markdown(request_id)}\\.\n\n"
         f"{body}"
@@ -261,11 +283,8 @@ async def claim_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode="MarkdownV2",
         )
 
-    demonstrator_id = context.bot_data.get(f"req_{request_id}_author")
+    demonstrator_id = request_state.get_author(context.bot_data, request_id)
     if demonstrator_id:
-        exhibit_match = re.search(r"🏛 \*Экспонат:\* (.+)", query.message.text)
-        exhibit_name = exhibit_match.group(1) if exhibit_match else "..."
-
         await context.bot.send_message(
             chat_id=demonstrator_id,
             text=f"⚙️ Инженер {helpers.escape_markdown(engineer_username_raw)} взял в работу вашу заявку \\#{helpers.escape_markdown(request_id)} "
@@ -274,49 +293,132 @@ async def claim_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
-async def show_requests(
-    update: Update, context: ContextTypes.DEFAULT_TYPE, status: str
-):
-    user = update.message.from_user
-    if not helpers.is_engineer(user.id, context):
-        await update.message.reply_text("Эта команда доступна только инженерам.")
-        return
+def _claimed_group_text(body, engineer_username_raw) -> str:
+    return (
+        f"⚙️ *Заявка в работе*\n\n"
+        f"{body}\n\n"
+        f"👷‍♂️ *Взял в работу:* {helpers.escape_markdown(engineer_username_raw)}"
+    )
 
-    requests = sheets.get_requests_by_status(status)
-    if not requests:
-        await update.message.reply_text(f"✅ Нет заявок со статусом «{status}».")
+
+@metrics.instrument_handler
+async def claim_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    request_id = str(query.data.split(c.CB_CLAIM_PREFIX)[1])
+
+    engineer_username_raw = await _try_claim(query, context, request_id)
+    if engineer_username_raw is False:
+        try:
+            await query.edit_message_reply_markup(reply_markup=None)
+        except Exception:
+            pass
+    if not engineer_username_raw:
         return
 
-    await update.message.reply_text(
-        f"*{helpers.escape_markdown(f'Заявки в статусе «{status}»')}:*",
+    original_text_v2 = query.message.text_markdown_v2
+    original_markup = query.message.reply_markup
+    try:
+        header, body = original_text_v2.split("\n\n", 1)
+    except ValueError:
+        header = ""
+        body = original_text_v2
+
+    await query.edit_message_text(
+        text=_claimed_group_text(body, engineer_username_raw),
+        reply_markup=None,
         parse_mode="MarkdownV2",
     )
 
-    user_mention = helpers.get_user_mention(user)
-    found_own_request = False
+    committed = await _commit_claim(query, context, request_id, engineer_username_raw)
+    if committed is not True:
+        # Без взявшего заявка снова свободна — возвращаем кнопку
+        if committed is None:
+            text, reply_markup = original_text_v2, original_markup
+        else:
+            text, reply_markup = _claimed_group_text(body, committed), None
+        try:
+            await query.edit_message_text(
+                text=text, reply_markup=reply_markup, parse_mode="MarkdownV2"
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось обновить сообщение о заявке {request_id}: {e}")
+        return
+
+    await _notify_claimed(query, context, request_id, engineer_username_raw, body)
+
+
+# --- СПИСКИ ЗАЯВОК (/new, /inprogress) ---
+
+# Страница из LISTING_PAGE_SIZE заявок с описаниями не длиннее
+# helpers.MAX_PROBLEM_LENGTH помещается в одно сообщение
+LISTING_PAGE_SIZE = 5
+# Сколько последних списков хранить в chat_data для перелистывания
+LISTINGS_KEPT = 5
+
+
+def _listing_item(req) -> dict:
+    return {
+        "id": str(req["id"]),
+        "exhibit": req.get("Экспонат", ""),
+        "demonstrator": req.get("demonstrator_username", "N/A"),
+        "problem": req.get("Проблема", "–"),
+        "engineer_name": req.get("Ответственный", ""),
+        "engineer_username": req.get("engineer_username", ""),
+        "claimed_by": None,
+    }
+
+
+def _item_body(item) -> str:
+    return (
+        f"👤 *Демонстратор:* {helpers.escape_markdown(item['demonstrator'])}\n"
+        f"🏛 *Экспонат:* {helpers.escape_markdown(item['exhibit'])}\n"
+        f"🔧 *Проблема:* {helpers.escape_markdown(item['problem'])}"
+    )
+
 
-    for req in requests:
-        req_id = str(req["id"])
+def _save_listing(context: ContextTypes.DEFAULT_TYPE, listing) -> int:
+    listings = context.chat_data.setdefault("listings", {})
+    token = context.chat_data.get("listing_seq", 0) + 1
+    context.chat_data["listing_seq"] = token
+    listings[token] = listing
+    for old_token in sorted(listings)[:-LISTINGS_KEPT]:
+        del listings[old_token]
+    return token
+
+
+def _render_listing(token: int, listing, page: int):
+    items = listing["items"]
+    status = listing["status"]
+    pages = max(1, -(-len(items) // LISTING_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    page_items = items[page * LISTING_PAGE_SIZE : (page + 1) * LISTING_PAGE_SIZE]
+
+    title = f"Заявки в статусе «{status}» — {len(items)}, стр. {page + 1}/{pages}"
+    blocks = [f"*{helpers.escape_markdown(title)}:*"]
+    keyboard = []
+    for item in page_items:
+        req_id = item["id"]
         text = (
             f"🆔 `{helpers.escape_markdown(req_id)}`\n"
-            f"🏛 *Экспонат:* {helpers.escape_markdown(req['Экспонат'])}\n"
-            f"👤 *Демонстратор:* {helpers.escape_markdown(req.get('demonstrator_username', 'N/A'))}\n"
-            f"🔧 *Проблема:* {helpers.escape_markdown(req.get('Проблема', '–'))}"
+            f"🏛 *Экспонат:* {helpers.escape_markdown(item['exhibit'])}\n"
+            f"👤 *Демонстратор:* {helpers.escape_markdown(item['demonstrator'])}\n"
+            f"🔧 *Проблема:* "
+            f"{helpers.escape_truncated(item['problem'], helpers.MAX_PROBLEM_LENGTH)}"
         )
-
-        keyboard = []
-        if status == "Новая":
+        if item["claimed_by"]:
+            text += f"\n⚙️ *Взял в работу:* {helpers.escape_markdown(item['claimed_by'])}"
+        elif status == "Новая":
             keyboard.append(
                 [
                     InlineKeyboardButton(
                         text=f"✅ Взять в работу #{req_id}",
-                        callback_data=f"{c.CB_CLAIM_PREFIX}{req_id}",
+                        callback_data=f"{c.CB_LIST_CLAIM_PREFIX}{token}_{page}_{req_id}",
                     )
                 ]
             )
         elif status == "В работе":
-            text += f"\n👷‍♂️ *Ответственный:* {helpers.escape_markdown(req.get('Ответственный', ''))}"
-            if req.get("engineer_username") == user_mention:
+            text += f"\n👷‍♂️ *Ответственный:* {helpers.escape_markdown(item['engineer_name'])}"
+            if item["engineer_username"] == listing["owner"]:
                 keyboard.append(
                     [
                         InlineKeyboardButton(
@@ -325,22 +427,125 @@ async def show_requests(
                         )
                     ]
                 )
-                found_own_request = True
+        blocks.append(text)
 
-        await update.message.reply_text(
-            text=text,
-            reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None,
-            parse_mode="MarkdownV2",
+    if status == "В работе" and not any(
+        item["engineer_username"] == listing["owner"] for item in items
+    ):
+        blocks.append(helpers.escape_markdown("ℹ️ У вас нет назначенных заявок в работе."))
+
+    navigation = []
+    if page > 0:
+        navigation.append(
+            InlineKeyboardButton(
+                "⬅️ Назад", callback_data=f"{c.CB_LIST_PAGE_PREFIX}{token}_{page - 1}"
+            )
+        )
+    if page < pages - 1:
+        navigation.append(
+            InlineKeyboardButton(
+                "Вперед ➡️", callback_data=f"{c.CB_LIST_PAGE_PREFIX}{token}_{page + 1}"
+            )
+        )
+    if navigation:
+        keyboard.append(navigation)
+
+    return "\n\n".join(blocks), InlineKeyboardMarkup(keyboard) if keyboard else None
+
+
+@metrics.instrument_handler
+async def show_requests(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, status: str
+):
+    user = update.message.from_user
+    if not helpers.is_engineer(user.id, context):
+        await update.message.reply_text("Эта команда доступна только инженерам.")
+        return
+
+    requests = await sheets_async.get_requests_by_status(status)
+    if not requests:
+        await update.message.reply_text(f"✅ Нет заявок со статусом «{status}».")
+        return
+
+    # Весь список сохраняется один раз; листание страниц обходится без таблицы
+    listing = {
+        "status": status,
+        "owner": helpers.get_user_mention(user),
+        "items": [_listing_item(req) for req in requests],
+    }
+    token = _save_listing(context, listing)
+    text, reply_markup = _render_listing(token, listing, 0)
+    await update.message.reply_text(
+        text=text, reply_markup=reply_markup, parse_mode="MarkdownV2"
+    )
+
+
+def _get_listing(context: ContextTypes.DEFAULT_TYPE, token: str):
+    return context.chat_data.get("listings", {}).get(int(token))
+
+
+@metrics.instrument_handler
+async def show_listing_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    token, page = query.data[len(c.CB_LIST_PAGE_PREFIX) :].split("_")
+    listing = _get_listing(context, token)
+    if listing is None:
+        await query.answer("Список устарел, запросите его заново.", show_alert=True)
+        return
+    await query.answer()
+    text, reply_markup = _render_listing(int(token), listing, int(page))
+    await query.edit_message_text(
+        text=text, reply_markup=reply_markup, parse_mode="MarkdownV2"
+    )
+
+
+async def _refresh_listing(query, listing, token, page):
+    text, reply_markup = _render_listing(int(token), listing, int(page))
+    try:
+        await query.edit_message_text(
+            text=text, reply_markup=reply_markup, parse_mode="MarkdownV2"
         )
+    except Exception as e:
+        logger.warning(f"Не удалось обновить список заявок: {e}")
 
-    if status == "В работе" and not found_own_request:
-        await update.message.reply_text("ℹ️ У вас нет назначенных заявок в работе.")
 
+@metrics.instrument_handler
+async def claim_from_listing(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    token, page, request_id = query.data[len(c.CB_LIST_CLAIM_PREFIX) :].split("_", 2)
+    listing = _get_listing(context, token)
+    item = next(
+        (i for i in (listing or {}).get("items", []) if i["id"] == request_id), None
+    )
 
+    engineer_username_raw = await _try_claim(query, context, request_id)
+    if item is not None and engineer_username_raw is not None:
+        item["claimed_by"] = engineer_username_raw or "другой инженер"
+        await _refresh_listing(query, listing, token, page)
+    if not engineer_username_raw:
+        return
+
+    committed = await _commit_claim(query, context, request_id, engineer_username_raw)
+    if committed is not True:
+        if item is not None:
+            item["claimed_by"] = committed
+            await _refresh_listing(query, listing, token, page)
+        return
+
+    if item is not None:
+        body = _item_body(item)
+    else:
+        req = await sheets_async.get_request(request_id) or {"id": request_id}
+        body = _item_body(_listing_item(req))
+    await _notify_claimed(query, context, request_id, engineer_username_raw, body)
+
+
+@metrics.instrument_handler
 async def show_new_requests(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await show_requests(update, context, "Новая")
 
 
+@metrics.instrument_handler
 async def show_in_progress_requests(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await show_requests(update, context, "В работе")
 
@@ -348,10 +553,16 @@ async def show_in_progress_requests(update: Update, context: ContextTypes.DEFAUL
 # --- ЭКСПОРТИРУЕМЫЕ ХЕНДЛЕРЫ ---
 
 claim_handler = CallbackQueryHandler(claim_request, pattern=f"^{c.CB_CLAIM_PREFIX}")
+listing_claim_handler = CallbackQueryHandler(
+    claim_from_listing, pattern=f"^{c.CB_LIST_CLAIM_PREFIX}"
+)
+listing_page_handler = CallbackQueryHandler(
+    show_listing_page, pattern=f"^{c.CB_LIST_PAGE_PREFIX}"
+)
 new_requests_handler = CommandHandler("new", show_new_requests)
 in_progress_requests_handler = CommandHandler("inprogress", show_in_progress_requests)
 
-completion_conv_handler = ConversationHandler(
+completion_conv_handler = SharedConversationHandler(
     entry_points=[
         CallbackQueryHandler(start_completion, pattern=f"^{c.CB_COMPLETE_PREFIX}")
     ],
@@ -367,5 +578,9 @@ completion_conv_handler = ConversationHandler(
     fallbacks=[CommandHandler("cancel", cancel_completion)],
     per_user=True,
     per_message=False,
+    # Таймаут не сохраняется в хранилище: состояния старше него закрывают
+    # shared_state.sync_conversations и drop_expired_conversations
     conversation_timeout=1800,
+    name="request_completion",
+    persistent=True,
 )
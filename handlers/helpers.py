@@ -4,13 +4,26 @@ import re
 from telegram import User
 from telegram.ext import ContextTypes
 
+import request_state
+from config import ADMIN_IDS
+
 logger = logging.getLogger(__name__)
 
+# Длинные описания проблем обрезаются: в списке страница из нескольких заявок
+# должна помещаться в одно сообщение (4096 знаков)
+MAX_PROBLEM_LENGTH = 500
+
 
 def is_engineer(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
     return user_id in context.bot_data.get("engineers", [])
 
 
+def is_admin(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    if ADMIN_IDS:
+        return user_id in ADMIN_IDS
+    return is_engineer(user_id, context)
+
+
 def get_user_mention(user: User) -> str:
     return f"@{user.username}" if user.username else user.full_name
 
@@ -22,23 +35,63 @@ def escape_markdown(text: str) -> str:
     return re.sub(f"([{re.escape(escape_chars)}])", r"\\\1", text)
 
 
+def escape_truncated(text, limit: int) -> str:
+    """Экранировать текст для MarkdownV2 так, чтобы результат был не длиннее limit.
+
+    Лишнее отрезается по исходным символам, поэтому экранирование не
+    разрезается; обрезанный текст заканчивается многоточием.
+    """
+    escaped = escape_markdown(text)
+    if len(escaped) <= limit:
+        return escaped
+    parts = []
+    length = 0
+    for char in str(text):
+        part = escape_markdown(char)
+        if length + len(part) > limit - 1:
+            break
+        parts.append(part)
+        length += len(part)
+    return "".join(parts) + "…"
+
+
+def split_message(blocks, limit: int = 4096, separator: str = "\n\n"):
+    """Собрать блоки текста в сообщения не длиннее limit.
+
+    Разрывы делаются только между блоками, поэтому экранирование MarkdownV2
+    внутри блока никогда не разрезается.
+    """
+    chunks = []
+    current = []
+    length = 0
+    for block in blocks:
+        extra = len(block) + (len(separator) if current else 0)
+        if current and length + extra > limit:
+            chunks.append(separator.join(current))
+            current, length = [], 0
+            extra = len(block)
+        current.append(block)
+        length += extra
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
 def track_request_message(
     context: ContextTypes.DEFAULT_TYPE, request_id: str, chat_id: int, message_id: int
 ):
-    key = f"messages_for_req_{request_id}"
-    if key not in context.bot_data:
-        context.bot_data[key] = []
-    context.bot_data[key].append((chat_id, message_id))
+    request_state.add_message(context.bot_data, request_id, chat_id, message_id)
 
 
 async def delete_tracked_messages(context: ContextTypes.DEFAULT_TYPE, request_id: str):
-    key = f"messages_for_req_{request_id}"
-    if key in context.bot_data:
-        for chat_id, message_id in context.bot_data[key]:
-            try:
-                await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-            except Exception as e:
-                logger.warning(
-                    f"Не удалось удалить сообщение {message_id} в чате {chat_id}: {e}"
-                )
-        del context.bot_data[key]
+    entry = request_state.get(context.bot_data, request_id)
+    if not entry:
+        return
+    for chat_id, message_id in entry["messages"]:
+        try:
+            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except Exception as e:
+            logger.warning(
+                f"Не удалось удалить сообщение {message_id} в чате {chat_id}: {e}"
+            )
+    entry["messages"] = []
@@ -0,0 +1,91 @@
+import contextlib
+import logging
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: счетчиком пользуется один процесс
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class RequestIdAllocator:
+    """Монотонный счетчик номеров заявок, сохраняемый на диск.
+
+    Последний выданный номер записывается в файл до того, как номер вернется
+    вызывающему, поэтому после перезапуска номера не повторяются. Файл
+    блокируется на время выдачи номера, так что один счетчик могут делить
+    несколько реплик бота.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._last = None
+
+    @property
+    def is_seeded(self) -> bool:
+        return self._last is not None
+
+    def seed(self, max_existing_id=None) -> bool:
+        """Инициализировать счетчик из файла и максимального номера в таблице."""
+        with self._lock:
+            stored = self._read()
+            if stored is None and max_existing_id is None:
+                return False
+            self._last = max(stored or 0, max_existing_id or 0)
+            return True
+
+    def allocate(self):
+        with self._lock:
+            if self._last is None:
+                return None
+            try:
+                with self._file_lock():
+                    # Номера могла выдавать и другая реплика
+                    next_id = max(self._last, self._read() or 0) + 1
+                    self._write(next_id)
+            except OSError as e:
+                logger.error(f"Не удалось сохранить счетчик номеров заявок: {e}")
+                return None
+            self._last = next_id
+            return next_id
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        self._ensure_directory()
+        with open(f"{self._path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _ensure_directory(self):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _read(self):
+        try:
+            with open(self._path, encoding="utf-8") as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.error(f"Файл счетчика {self._path} поврежден, он будет перезаписан")
+            return None
+
+    def _write(self, value: int):
+        self._ensure_directory()
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(value))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path)
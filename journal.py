@@ -0,0 +1,249 @@
+"""Журнал событий заявок — локальный источник истины.
+
+Каждое изменение заявки (создание, смена статуса) дописывается строкой JSON
+в файл журнала и сбрасывается на диск до того, как обработчик ответит
+пользователю. Лист «Заявки» — асинхронная копия: фоновая задача переносит
+в таблицу события, которые туда еще не попали (sheets.sync_journal).
+
+Рядом с журналом лежат:
+- {path}.replicated — номер последнего перенесенного в таблицу события;
+- {path}.snapshot — снимок кэша заявок; при запуске кэш восстанавливается
+  из снимка и событий после него, без чтения таблицы.
+
+Журнал могут делить несколько реплик бота (SHARED_STATE): запись идет под
+блокировкой файла, а перед записью реплика дочитывает чужие события.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: журналом пользуется один процесс
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class RequestJournal:
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        # Прочитанные и записанные события, еще не перенесенные в таблицу
+        self._events = []
+        self._offset = 0
+        self._inode = None
+        self.last_seq = 0
+        # Чужие события пропали при сжатии журнала — кэш нужно перестроить
+        self.gap = False
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Монопольный доступ к журналу; отдает новые события других реплик."""
+        with self._lock:
+            with self._file_lock():
+                yield self._read_new()
+
+    def read_new(self):
+        """Дочитать события, дописанные другими репликами."""
+        with self.locked() as events:
+            return events
+
+    def append(self, event: dict) -> dict:
+        """Дописать событие; вызывается внутри locked()."""
+        event = dict(event, seq=self.last_seq + 1)
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        self._ensure_directory()
+        with open(self._path, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset = f.tell()
+            self._inode = os.fstat(f.fileno()).st_ino
+        self._events.append(event)
+        self.last_seq = event["seq"]
+        return event
+
+    def pending(self, after_seq: int):
+        with self._lock:
+            return [event for event in self._events if event["seq"] > after_seq]
+
+    @property
+    def replicated_seq(self) -> int:
+        return self._read_counter(f"{self._path}.replicated")
+
+    @property
+    def layout_version(self) -> int:
+        """Счетчик удалений строк листа; по нему реплики сбрасывают номера строк."""
+        return self._read_counter(f"{self._path}.layout")
+
+    def bump_layout(self):
+        """Отметить, что строки листа сдвинулись; вызывается внутри replicator()."""
+        self._write_atomic(f"{self._path}.layout", str(self.layout_version + 1))
+
+    def mark_replicated(self, seq: int):
+        with self._lock:
+            self._write_atomic(f"{self._path}.replicated", str(seq))
+            self.forget_until(seq)
+
+    def forget_until(self, seq: int):
+        """Забыть события до seq включительно — они уже в таблице."""
+        with self._lock:
+            self._events = [event for event in self._events if event["seq"] > seq]
+
+    def load_snapshot(self):
+        try:
+            with open(f"{self._path}.snapshot", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.error(f"Снимок {self._path}.snapshot поврежден, он будет пропущен")
+            return None
+
+    def write_snapshot(self, snapshot: dict):
+        """Записать снимок; вызывается внутри locked()."""
+        self._write_atomic(
+            f"{self._path}.snapshot", json.dumps(snapshot, ensure_ascii=False)
+        )
+
+    def compact(self, upto_seq: int):
+        """Удалить из файла события до upto_seq включительно; внутри locked()."""
+        try:
+            with open(self._path, "rb") as f:
+                lines = f.read().splitlines(keepends=True)
+        except FileNotFoundError:
+            return
+        kept = [line for line in lines if self._seq_of(line) > upto_seq]
+        if len(kept) == len(lines):
+            return
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path)
+        stat = os.stat(self._path)
+        self._inode, self._offset = stat.st_ino, stat.st_size
+        logger.info(f"Журнал заявок сжат до события {upto_seq}")
+
+    def _read_new(self):
+        first_read = self._inode is None
+        events = self._read_file()
+        if first_read:
+            # Сжатие удаляет только перенесенные в таблицу события, поэтому
+            # нумерация продолжается не ниже отметки переноса. Поднимаем ее
+            # только после чтения: перенесенные события после снимка нужны
+            # для восстановления кэша
+            self.last_seq = max(self.last_seq, self.replicated_seq)
+        return events
+
+    def _read_file(self):
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return []
+        if stat.st_ino != self._inode:
+            # Первое чтение или журнал сжала другая реплика
+            self._inode, self._offset = stat.st_ino, 0
+        with open(self._path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # Незаконченная строка — запись, оборванная падением процесса
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        events = []
+        for line in data[:end].splitlines():
+            try:
+                event = json.loads(line)
+            except ValueError:
+                if line.strip():
+                    logger.error(f"Пропущена поврежденная запись журнала: {line[:80]!r}")
+                continue
+            if event["seq"] <= self.last_seq:
+                continue
+            if self.last_seq and event["seq"] > self.last_seq + 1:
+                self.gap = True
+            events.append(event)
+            self.last_seq = event["seq"]
+        self._events.extend(events)
+        return events
+
+    @staticmethod
+    def _seq_of(line):
+        try:
+            return json.loads(line)["seq"]
+        except (ValueError, KeyError):
+            return 0
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        # Блокировка файла не реентерабельна, поэтому берется только на
+        # внешнем уровне вложенных locked()
+        if fcntl is None or self._depth:
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+        self._ensure_directory()
+        with open(f"{self._path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def replicator(self, wait=False):
+        """Право переносить журнал в таблицу; False, если его держит другая реплика.
+
+        С wait блокировка ожидается — так ее берет перенос в архив, который
+        сдвигает строки листа. Блокировка файла снимается и при падении процесса.
+        """
+        if fcntl is None:
+            yield True
+            return
+        self._ensure_directory()
+        with open(f"{self._path}.replicator.lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _ensure_directory(self):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _read_counter(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            logger.error(f"Файл {path} поврежден")
+            return 0
+
+    def _write_atomic(self, path, text):
+        self._ensure_directory()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
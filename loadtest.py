@@ -0,0 +1,340 @@
+"""Нагрузочный тест обработчиков бота без сети.
+
+Синтетические Update прогоняются через приложение из main.build_application():
+Telegram Bot API подменен заглушкой, Google Sheets — таблицей в памяти
+(sheets_backend.FakeBackend). Каждый виртуальный пользователь проходит полный
+цикл заявки: создание через диалог демонстратора, /new, взятие в работу,
+/inprogress, завершение и /myrequests.
+
+Пример:
+    python loadtest.py --users 20 --iterations 10 --sheets-latency 0.2
+"""
+
+import os
+import sys
+import tempfile
+
+# Конфигурация читается при импорте, поэтому окружение задается до импорта
+# модулей бота
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+os.environ.setdefault("ENGINEERS_CHAT_ID", "-1000000000001")
+os.environ.setdefault("GSHEETS_TABLE_NAME", "loadtest")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="robostation-loadtest-"))
+os.environ["SHEETS_BACKEND"] = "fake"
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import itertools  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import time  # noqa: E402
+import warnings  # noqa: E402
+from collections import Counter, defaultdict  # noqa: E402
+
+from telegram import Update  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+from telegram.warnings import PTBUserWarning  # noqa: E402
+
+# Предупреждения о per_message и неработающем JobQueue при замерах не важны
+warnings.filterwarnings("ignore", category=PTBUserWarning)
+
+import constants as c  # noqa: E402
+import content_catalog  # noqa: E402
+import sheets  # noqa: E402
+from config import ENGINEERS_CHAT_ID, SHEET_NAMES  # noqa: E402
+from main import build_application  # noqa: E402
+from persistence import SQLitePersistence  # noqa: E402
+from sheets_backend import DEFAULT_FAKE_SHEETS, FakeBackend  # noqa: E402
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Robostation", "username": "robostation_bot"}
+ENGINEER_BASE_ID = 5_000_000
+DEMONSTRATOR_BASE_ID = 1_000_000
+EXHIBITS = {f"Экспонат {i}": [f"Проблема {i}.{j}" for j in range(3)] for i in range(10)}
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Заглушка Bot API: отвечает на методы, которыми пользуется бот."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params):
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            result = self._message(params)
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def _user(user_id, name):
+    return {"id": user_id, "is_bot": False, "first_name": name, "username": name}
+
+
+def _message_update(update_id, user, chat_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+def _callback_update(update_id, user, chat_id, data, message_text=""):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+                "from": BOT_USER,
+                "text": message_text,
+            },
+        },
+    }
+
+
+class LoadTest:
+    def __init__(self, users, engineers, sheets_latency, telegram_latency):
+        self.users = users
+        self.engineers = engineers
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self._update_ids = itertools.count(1)
+
+        engineer_rows = [["Имя", "Telegram ID"]] + [
+            [f"Инженер {i}", str(ENGINEER_BASE_ID + i)] for i in range(engineers)
+        ]
+        content_rows = [["Экспонат", "Проблема 1", "Проблема 2", "Проблема 3"]] + [
+            [exhibit, *problems] for exhibit, problems in EXHIBITS.items()
+        ]
+        fake_sheets = dict(DEFAULT_FAKE_SHEETS)
+        fake_sheets[SHEET_NAMES["engineers"]] = engineer_rows
+        fake_sheets[SHEET_NAMES["content"]] = content_rows
+        self.workbook = FakeBackend(fake_sheets, latency=sheets_latency).open()
+        sheets.use_workbook(self.workbook)
+
+        self.telegram = FakeTelegramRequest(telegram_latency)
+        persistence = SQLitePersistence(
+            os.path.join(tempfile.mkdtemp(prefix="robostation-loadtest-"), "bot_data.sqlite3")
+        )
+        self.application = build_application(persistence, request=self.telegram)
+
+    async def _send(self, step, payload):
+        update = Update.de_json(payload, self.application.bot)
+        started = time.perf_counter()
+        try:
+            await self.application.process_update(update)
+        except Exception as e:
+            self.errors[step] += 1
+            logging.getLogger(__name__).error(f"{step}: {e}")
+        self.latencies[step].append(time.perf_counter() - started)
+
+    def _next_id(self):
+        return next(self._update_ids)
+
+    async def run_cycle(self, worker: int):
+        demonstrator = _user(DEMONSTRATOR_BASE_ID + worker, f"demo{worker}")
+        engineer_id = ENGINEER_BASE_ID + worker % self.engineers
+        engineer = _user(engineer_id, f"eng{worker % self.engineers}")
+        exhibit = list(EXHIBITS)[worker % len(EXHIBITS)]
+        problem = EXHIBITS[exhibit][0]
+        d_chat = demonstrator["id"]
+
+        await self._send("start", _message_update(self._next_id(), demonstrator, d_chat, "/start"))
+        await self._send(
+            "select_exhibit",
+            _callback_update(self._next_id(), demonstrator, d_chat, c.CB_NEW_REQUEST),
+        )
+        await self._send(
+            "select_problem",
+            _callback_update(
+                self._next_id(), demonstrator, d_chat, content_catalog.exhibit_callback(exhibit)
+            ),
+        )
+        requests_before = set(self._request_ids(demonstrator))
+        await self._send(
+            "submit_request",
+            _callback_update(
+                self._next_id(), demonstrator, d_chat, content_catalog.problem_callback(exhibit, problem)
+            ),
+        )
+        new_ids = set(self._request_ids(demonstrator)) - requests_before
+        if not new_ids:
+            self.errors["submit_request"] += 1
+            return
+        request_id = new_ids.pop()
+
+        await self._send(
+            "show_new_requests",
+            _message_update(self._next_id(), engineer, int(ENGINEERS_CHAT_ID), "/new"),
+        )
+        announcement = (
+            f"‼️ Новая заявка #{request_id} ‼️\n\n"
+            f"👤 Демонстратор: @demo{worker}\n🏛 Экспонат: {exhibit}\n🔧 Проблема: {problem}"
+        )
+        await self._send(
+            "claim_request",
+            _callback_update(
+                self._next_id(),
+                engineer,
+                int(ENGINEERS_CHAT_ID),
+                f"{c.CB_CLAIM_PREFIX}{request_id}",
+                announcement,
+            ),
+        )
+        await self._send(
+            "show_in_progress_requests",
+            _message_update(self._next_id(), engineer, engineer_id, "/inprogress"),
+        )
+        await self._send(
+            "start_completion",
+            _callback_update(
+                self._next_id(), engineer, engineer_id, f"{c.CB_COMPLETE_PREFIX}{request_id}"
+            ),
+        )
+        await self._send(
+            "complete_with_reboot",
+            _callback_update(
+                self._next_id(), engineer, engineer_id, f"{c.CB_COMPLETE_REBOOT}{request_id}"
+            ),
+        )
+        await self._send(
+            "show_my_requests",
+            _message_update(self._next_id(), demonstrator, d_chat, "/myrequests"),
+        )
+
+    def _request_ids(self, demonstrator):
+        return [
+            r["id"] for r in sheets.get_requests_by_demonstrator(f"@{demonstrator['username']}")
+        ]
+
+    async def run(self, iterations: int):
+        await self.application.initialize()
+        engineers, content = sheets.fetch_reference_data(force=True)
+        self.application.bot_data["engineers"] = engineers
+        self.application.bot_data["content"] = content
+
+        async def worker(index):
+            for _ in range(iterations):
+                await self.run_cycle(index)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(self.users)))
+        elapsed = time.perf_counter() - started
+
+        # Число запросов к таблице на операцию замеряется отдельным
+        # последовательным проходом уже на прогретом кэше
+        calls_per_step = {}
+        original_send = self._send
+
+        async def counting_send(step, payload):
+            before = sum(self.workbook.calls.values())
+            await original_send(step, payload)
+            calls_per_step[step] = sum(self.workbook.calls.values()) - before
+
+        self._send = counting_send
+        await self.run_cycle(self.users)
+        self._send = original_send
+
+        # Обработчики пишут в журнал; в таблицу его переносит фоновая задача
+        started = time.perf_counter()
+        self.replicated = 0
+        while sheets.journal_backlog():
+            self.replicated += sheets.sync_journal() or 0
+        self.replication_time = time.perf_counter() - started
+
+        await self.application.shutdown()
+        return elapsed, calls_per_step
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def report(test: LoadTest, elapsed, calls_per_step):
+    print(f"\nВремя прогона: {elapsed:.2f} с")
+    print(
+        f"{'Обработчик':<28}{'N':>6}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+        f"{'Sheets':>8}{'Ошибки':>8}"
+    )
+    for step, values in test.latencies.items():
+        values = sorted(values)
+        print(
+            f"{step:<28}{len(values):>6}"
+            f"{_percentile(values, 0.50) * 1000:>10.1f}"
+            f"{_percentile(values, 0.95) * 1000:>10.1f}"
+            f"{_percentile(values, 0.99) * 1000:>10.1f}"
+            f"{calls_per_step.get(step, 0):>8}"
+            f"{test.errors.get(step, 0):>8}"
+        )
+    print(
+        f"\nСобытий журнала перенесено в таблицу: {test.replicated} "
+        f"за {test.replication_time:.2f} с"
+    )
+    print(f"Запросы к Google Sheets: {dict(test.workbook.calls)}")
+    print(f"Запросы к Telegram: {dict(test.telegram.calls)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10, help="одновременных пользователей")
+    parser.add_argument("--engineers", type=int, default=5, help="инженеров в таблице")
+    parser.add_argument("--iterations", type=int, default=5, help="циклов на пользователя")
+    parser.add_argument(
+        "--sheets-latency", type=float, default=0.0, help="задержка запроса к таблице, с"
+    )
+    parser.add_argument(
+        "--telegram-latency", type=float, default=0.0, help="задержка запроса к Telegram, с"
+    )
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    test = LoadTest(args.users, args.engineers, args.sheets_latency, args.telegram_latency)
+    elapsed, calls_per_step = asyncio.run(test.run(args.iterations))
+    report(test, elapsed, calls_per_step)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
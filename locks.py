@@ -0,0 +1,48 @@
+import contextlib
+import threading
+
+
+class SharedExclusiveLock:
+    """Блокировка с совместным и монопольным режимами.
+
+    Записи по номерам строк берут ее совместно и не мешают друг другу;
+    удаление строк, сдвигающее нумерацию, — монопольно. Монопольный режим
+    в очереди не пропускает новых совместных владельцев. Не реентерабельна.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @contextlib.contextmanager
+    def shared(self):
+        with self._condition:
+            while self._exclusive or self._exclusive_waiting:
+                self._condition.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._shared -= 1
+                if not self._shared:
+                    self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._condition:
+            self._exclusive_waiting += 1
+            try:
+                while self._exclusive or self._shared:
+                    self._condition.wait()
+            finally:
+                self._exclusive_waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
@@ -1,17 +1,62 @@
 import logging
 
-from telegram.ext import Application, PicklePersistence
+from telegram import Update
+from telegram.ext import Application, TypeHandler
 
-from config import BOT_TOKEN
-from handlers.common import my_requests_handler, update_data_from_sheets
+import metrics
+import request_state
+import sheets
+import sheets_async
+from config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_INTERVAL,
+    BOT_TOKEN,
+    LEGACY_PICKLE_FILE,
+    METRICS_HOST,
+    METRICS_PORT,
+    PERSISTENCE_FILE,
+    REQUEST_JOURNAL_MAX_LAG,
+    REQUEST_JOURNAL_SYNC_INTERVAL,
+    REQUESTS_RECONCILE_INTERVAL,
+    SHARED_STATE,
+    SHEETS_KEEPALIVE_INTERVAL,
+    UPDATES_MODE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_TLS_CERT,
+    WEBHOOK_TLS_KEY,
+    WEBHOOK_URL,
+)
+from handlers.common import (
+    archive_requests,
+    my_requests_handler,
+    my_requests_history_handler,
+    maintain_sheets_connection,
+    reconcile_requests,
+    reload_handler,
+    stats_handler,
+    sweep_request_state,
+    sync_request_journal,
+    update_data_from_sheets,
+)
 from handlers.demonstrator import conv_handler
 from handlers.engineer import (
     claim_handler,
     completion_conv_handler,
     in_progress_requests_handler,
+    listing_claim_handler,
+    listing_page_handler,
     new_requests_handler,
 )
-from reminders import check_and_send_reminders
+from persistence import SQLitePersistence
+from reminders import restore_reminders
+from shared_state import (
+    drop_expired_conversations,
+    persist_after_update,
+    sync_conversations,
+)
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
@@ -19,16 +64,93 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def main() -> None:
-    persistence = PicklePersistence(filepath="bot_data.pickle")
-    application = (
-        Application.builder().token(BOT_TOKEN).persistence(persistence).build()
+_metrics_server = None
+
+
+def _readiness_problems(application: Application):
+    problems = []
+    if not application.running:
+        problems.append("приложение не запущено")
+    if application.updater is None or not application.updater.running:
+        problems.append("получение апдейтов не запущено")
+    # Без Google Sheets бот продолжает работать на журнале заявок, поэтому
+    # неготовым считается, только если перенос в таблицу слишком отстал
+    lag = sheets.journal_backlog_age()
+    if REQUEST_JOURNAL_MAX_LAG and lag > REQUEST_JOURNAL_MAX_LAG:
+        problems.append(
+            f"журнал заявок не переносится в таблицу {lag:.0f} с "
+            f"(событий: {sheets.journal_backlog()})"
+        )
+    return problems
+
+
+async def post_init(application: Application) -> None:
+    global _metrics_server
+    request_state.migrate_legacy_keys(application.bot_data)
+    await drop_expired_conversations(application)
+    if METRICS_PORT:
+        _metrics_server = metrics.MetricsServer(
+            METRICS_HOST,
+            METRICS_PORT,
+            readiness=lambda: _readiness_problems(application),
+        )
+        try:
+            await _metrics_server.start()
+        except OSError as e:
+            logger.error(f"Не удалось запустить сервер метрик: {e}")
+            _metrics_server = None
+
+
+async def post_shutdown(application: Application) -> None:
+    if _metrics_server:
+        await _metrics_server.stop()
+    # Переносим в таблицу накопленные события и сохраняем снимок, чтобы
+    # следующий запуск не читал лист целиком
+    await sheets_async.sync_journal(snapshot=True)
+    sheets_async.shutdown()
+
+
+def build_application(persistence=None, request=None) -> Application:
+    """Собрать приложение со всеми задачами и обработчиками.
+
+    persistence и request можно подменить — так делает нагрузочный тест
+    loadtest.py, которому не нужны ни диск, ни настоящий Telegram.
+    """
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
     )
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
 
     job_queue = application.job_queue
+    # Подключение к таблице открывается в фоне и не задерживает запуск;
+    # та же задача переподключается и заранее обновляет токен доступа
+    job_queue.run_repeating(
+        maintain_sheets_connection, interval=SHEETS_KEEPALIVE_INTERVAL, first=0
+    )
     job_queue.run_repeating(update_data_from_sheets, interval=300, first=1)
-    # Проверяем напоминания каждые 10 минут
-    job_queue.run_repeating(check_and_send_reminders, interval=600, first=60)
+    # Изменения заявок пишутся в локальный журнал, а в таблицу переносятся в фоне
+    job_queue.run_repeating(
+        sync_request_journal, interval=REQUEST_JOURNAL_SYNC_INTERVAL, first=1
+    )
+    # Сверяем кэш заявок с таблицей на случай правок вручную
+    job_queue.run_repeating(
+        reconcile_requests, interval=REQUESTS_RECONCILE_INTERVAL, first=5
+    )
+    # Напоминания планируются отдельной задачей на каждую заявку в работе;
+    # после перезапуска восстанавливаем их из сохраненных данных
+    job_queue.run_once(restore_reminders, when=1)
+    # Раз в час чистим состояние закрытых и забытых заявок
+    job_queue.run_repeating(sweep_request_state, interval=3600, first=120)
+    # Давно завершенные заявки переносим в архив, чтобы лист заявок не рос
+    if ARCHIVE_AFTER_DAYS > 0:
+        job_queue.run_repeating(archive_requests, interval=ARCHIVE_INTERVAL, first=600)
 
     # Регистрация хендлеров. ПОРЯДОК ВАЖЕН!
 
@@ -37,17 +159,48 @@ def main() -> None:
 
     # 2. Обработчики кнопок
     application.add_handler(claim_handler)
+    application.add_handler(listing_claim_handler)
+    application.add_handler(listing_page_handler)
+    application.add_handler(my_requests_history_handler)
     application.add_handler(completion_conv_handler)
 
     # 3. Обработчики команд
     application.add_handler(new_requests_handler)
     application.add_handler(in_progress_requests_handler)
     application.add_handler(my_requests_handler)
+    application.add_handler(reload_handler)
+    application.add_handler(stats_handler)
 
     # 4. Обработчик для комментариев (ставим его в конец, но перед любыми "общими" текстовыми)
 
-    logger.info("Бот запущен и готов к работе!")
-    application.run_polling()
+    # 5. С несколькими репликами состояние диалогов сверяется до обработки
+    # апдейта, а изменения записываются после нее
+    if SHARED_STATE:
+        application.add_handler(TypeHandler(Update, sync_conversations), group=-1)
+        application.add_handler(TypeHandler(Update, persist_after_update), group=100)
+
+    return application
+
+
+def main() -> None:
+    persistence = SQLitePersistence(
+        filepath=PERSISTENCE_FILE, legacy_pickle_path=LEGACY_PICKLE_FILE
+    )
+    application = build_application(persistence)
+    if UPDATES_MODE == "webhook":
+        logger.info(f"Бот запущен, апдейты принимаются на вебхук /{WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            cert=WEBHOOK_TLS_CERT,
+            key=WEBHOOK_TLS_KEY,
+        )
+    else:
+        logger.info("Бот запущен и готов к работе!")
+        application.run_polling()
 
 
 if __name__ == "__main__":
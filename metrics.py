@@ -0,0 +1,319 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Собираются длительности обработчиков и периодических задач, функций sheets.py
+(вместе с ожиданием в очереди пула) и отдельных запросов к API Google Sheets,
+а также задержка цикла событий. Метрики отдаются по HTTP на
+METRICS_HOST:METRICS_PORT/metrics; там же /healthz (процесс жив и цикл событий
+отвечает) и /readyz (бот готов обрабатывать апдейты).
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            buckets, total, count = self._values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            buckets = tuple(
+                n + 1 if value <= bound else n for n, bound in zip(buckets, self.buckets)
+            )
+            self._values[key] = (buckets, total + value, count + 1)
+
+    def _render_value(self, key, value):
+        buckets, total, count = value
+        lines = [
+            f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {n}"
+            for bound, n in zip(self.buckets, buckets)
+        ]
+        # В корзину +Inf попадают все наблюдения, в том числе больше верхней границы
+        lines.append(
+            f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}"
+        )
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+handler_duration = Histogram(
+    "robostation_handler_duration_seconds",
+    "Длительность обработки апдейта, по обработчикам",
+    ("handler",),
+)
+handler_errors = Counter(
+    "robostation_handler_errors_total",
+    "Необработанные исключения в обработчиках",
+    ("handler",),
+)
+job_duration = Histogram(
+    "robostation_job_duration_seconds",
+    "Длительность периодических задач JobQueue",
+    ("job",),
+)
+job_errors = Counter(
+    "robostation_job_errors_total",
+    "Необработанные исключения в задачах JobQueue",
+    ("job",),
+)
+sheets_call_duration = Histogram(
+    "robostation_sheets_call_duration_seconds",
+    "Длительность функций sheets.py с учетом ожидания в очереди пула",
+    ("function", "outcome"),
+)
+sheets_api_duration = Histogram(
+    "robostation_sheets_api_request_duration_seconds",
+    "Длительность запросов к API Google Sheets, по методам gspread",
+    ("method",),
+)
+sheets_api_errors = Counter(
+    "robostation_sheets_api_errors_total",
+    "Ошибки запросов к API Google Sheets, по методам gspread и HTTP-статусу",
+    ("method", "status"),
+)
+sheets_api_retries = Counter(
+    "robostation_sheets_api_retries_total",
+    "Повторы запросов к API Google Sheets после 429 и ошибок сервера",
+    ("method", "status"),
+)
+sheets_quota_wait = Histogram(
+    "robostation_sheets_quota_wait_seconds",
+    "Ожидание жетона квоты перед запросом к API Google Sheets",
+    ("kind", "lane"),
+)
+event_loop_lag = Histogram(
+    "robostation_event_loop_lag_seconds",
+    "Насколько позже запланированного просыпается цикл событий",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+journal_backlog = Gauge(
+    "robostation_journal_backlog_events",
+    "События журнала заявок, еще не перенесенные в таблицу",
+)
+journal_backlog_age = Gauge(
+    "robostation_journal_backlog_age_seconds",
+    "Сколько ждет переноса в таблицу самое старое событие журнала",
+)
+event_loop_lag_last = Gauge(
+    "robostation_event_loop_lag_last_seconds",
+    "Последний замер задержки цикла событий",
+)
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _timed(histogram, errors, label):
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                errors.inc(**{label: name})
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, **{label: name})
+
+        return wrapper
+
+    return decorator
+
+
+instrument_handler = _timed(handler_duration, handler_errors, "handler")
+instrument_job = _timed(job_duration, job_errors, "job")
+
+
+def _error_status(error) -> str:
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return str(status) if status else type(error).__name__
+
+
+class InstrumentedApi:
+    """Обертка над книгой или листом gspread, замеряющая каждый вызов API.
+
+    Листы, которые возвращает worksheet(), тоже оборачиваются.
+    """
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                sheets_api_errors.inc(method=name, status=_error_status(e))
+                raise
+            finally:
+                sheets_api_duration.observe(time.perf_counter() - started, method=name)
+            if name in ("worksheet", "add_worksheet"):
+                return InstrumentedApi(result)
+            return result
+
+        return call
+
+
+async def _monitor_event_loop(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - expected, 0.0)
+        event_loop_lag.observe(lag)
+        event_loop_lag_last.set(lag)
+
+
+def _response(path, readiness):
+    if path == "/metrics":
+        return "200 OK", "text/plain; version=0.0.4; charset=utf-8", render()
+    if path == "/healthz":
+        return "200 OK", "text/plain; charset=utf-8", "ok\n"
+    if path == "/readyz":
+        problems = readiness() if readiness else []
+        if problems:
+            return (
+                "503 Service Unavailable",
+                "text/plain; charset=utf-8",
+                "\n".join(problems) + "\n",
+            )
+        return "200 OK", "text/plain; charset=utf-8", "ready\n"
+    return "404 Not Found", "text/plain; charset=utf-8", "Not Found\n"
+
+
+async def _handle_http(reader, writer, readiness=None):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Заголовки запроса не нужны, но их надо дочитать
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?", 1)[0] if len(parts) > 1 else ""
+        status, content_type, text = _response(path, readiness)
+        body = text.encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug(f"Запрос к метрикам прерван: {e}")
+    finally:
+        writer.close()
+
+
+class MetricsServer:
+    """HTTP-сервер метрик и проверок состояния.
+
+    readiness — функция без аргументов, возвращающая список причин, по которым
+    бот не готов; пустой список означает готовность.
+    """
+
+    def __init__(self, host: str, port: int, readiness=None, loop_lag_interval: float = 0.5):
+        self.host = host
+        self.port = port
+        self.readiness = readiness
+        self.loop_lag_interval = loop_lag_interval
+        self._server = None
+        self._monitor = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            functools.partial(_handle_http, readiness=self.readiness), self.host, self.port
+        )
+        self._monitor = asyncio.create_task(_monitor_event_loop(self.loop_lag_interval))
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._monitor:
+            self._monitor.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
@@ -0,0 +1,579 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import pathlib
+import pickle
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from request_state import STATE_KEY
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bot_data (key TEXT PRIMARY KEY, value BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL, key TEXT NOT NULL, state BLOB NOT NULL, updated_at REAL,
+    PRIMARY KEY (name, key)
+);
+CREATE TABLE IF NOT EXISTS callback_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS request_state (
+    request_id TEXT PRIMARY KEY, author_id INTEGER,
+    engineer_id INTEGER, claim_time TEXT, last_reminder_time TEXT,
+    expires_at TEXT
+);
+CREATE TABLE IF NOT EXISTS request_messages (
+    request_id TEXT NOT NULL, position INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL,
+    PRIMARY KEY (request_id, position)
+);
+CREATE TABLE IF NOT EXISTS locks (
+    name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL
+);
+"""
+
+# Признак «в хранилище ничего нового» для refresh_*
+_UNCHANGED = object()
+
+
+def _dump(value) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _format_time(value):
+    return value.isoformat() if value else None
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _load_request_state(conn):
+    entries = {}
+    rows = conn.execute(
+        "SELECT request_id, author_id, engineer_id, claim_time, last_reminder_time, "
+        "expires_at FROM request_state"
+    )
+    for request_id, author_id, engineer_id, claim_time, last_reminder, expires in rows:
+        claim = None
+        if engineer_id is not None:
+            claim = {
+                "engineer_id": engineer_id,
+                "claim_time": _parse_time(claim_time),
+                "last_reminder_time": _parse_time(last_reminder),
+            }
+        entries[request_id] = {
+            "author_id": author_id,
+            "messages": [],
+            "claim": claim,
+            "expires_at": _parse_time(expires),
+        }
+    rows = conn.execute(
+        "SELECT request_id, chat_id, message_id FROM request_messages "
+        "ORDER BY request_id, position"
+    )
+    for request_id, chat_id, message_id in rows:
+        if request_id in entries:
+            entries[request_id]["messages"].append((chat_id, message_id))
+    return entries
+
+
+def _delete_request_state(conn, request_id):
+    conn.execute("DELETE FROM request_state WHERE request_id = ?", (request_id,))
+    conn.execute("DELETE FROM request_messages WHERE request_id = ?", (request_id,))
+
+
+def _write_request_state(conn, entries, previous):
+    """Записать только изменившиеся записи реестра заявок."""
+    for request_id, entry in entries.items():
+        if previous.get(request_id) == entry:
+            continue
+        claim = entry.get("claim") or {}
+        conn.execute(
+            "INSERT OR REPLACE INTO request_state VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                request_id,
+                entry.get("author_id"),
+                claim.get("engineer_id"),
+                _format_time(claim.get("claim_time")),
+                _format_time(claim.get("last_reminder_time")),
+                _format_time(entry.get("expires_at")),
+            ),
+        )
+        conn.execute("DELETE FROM request_messages WHERE request_id = ?", (request_id,))
+        conn.executemany(
+            "INSERT INTO request_messages VALUES (?, ?, ?, ?)",
+            [
+                (request_id, position, chat_id, message_id)
+                for position, (chat_id, message_id) in enumerate(entry["messages"])
+            ],
+        )
+    for request_id in previous:
+        if request_id not in entries:
+            _delete_request_state(conn, request_id)
+
+
+def _merge(local, stored, snapshot):
+    """Влить в local изменения из хранилища, не затирая несохраненные локальные.
+
+    snapshot — то, что было в хранилище при последнем чтении или записи.
+    Возвращает новый снимок: содержимое хранилища, кроме ключей, которые
+    изменены локально и еще ждут записи.
+    """
+    new_snapshot = {}
+    for key in set(stored) | set(snapshot) | set(local):
+        changed_locally = local.get(key, _UNCHANGED) != snapshot.get(key, _UNCHANGED)
+        if changed_locally:
+            if key in snapshot:
+                new_snapshot[key] = snapshot[key]
+            continue
+        if key in stored:
+            local[key] = copy.deepcopy(stored[key])
+            new_snapshot[key] = copy.deepcopy(stored[key])
+        else:
+            local.pop(key, None)
+    return new_snapshot
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранилище данных бота в SQLite (режим WAL).
+
+    В отличие от PicklePersistence пишет только изменившиеся ключи bot_data,
+    а реестр заявок (bot_data["request_state"]) хранит в отдельных таблицах
+    и обновляет построчно — только изменившиеся заявки.
+
+    Один файл могут использовать несколько процессов бота (реплик) на общем
+    томе: refresh_* подтягивают записи других реплик (проверка дешевая —
+    PRAGMA data_version), а таблица locks дает блокировки между репликами.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        store_data: PersistenceInput = None,
+        update_interval: float = 60,
+        legacy_pickle_path: str = None,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = filepath
+        self.legacy_pickle_path = legacy_pickle_path
+        self._conn = None
+        self._lock = threading.Lock()
+        # Отдельное соединение для чтения состояния диалогов: в режиме WAL
+        # чтение не ждет записей других реплик и не стоит в очереди за _lock
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        # Копия bot_data на момент последней записи — по ней определяется,
+        # какие ключи изменились
+        self._bot_data_snapshot = {}
+        # Что уже сверено с хранилищем после последней записи другой реплики
+        self._data_version = None
+        self._bot_data_fresh = False
+        # None — свежие все записи, иначе множество уже сверенных id
+        self._fresh_users = set()
+        self._fresh_chats = set()
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.filepath)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            is_new = not os.path.exists(self.filepath)
+            conn = sqlite3.connect(
+                self.filepath, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Другая реплика может держать блокировку записи — ждем, а не падаем
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(_SCHEMA)
+            self._migrate(conn)
+            self._conn = conn
+            if is_new:
+                self._import_legacy_pickle()
+        return self._conn
+
+    @staticmethod
+    def _migrate(conn):
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(conversations)")]
+        if "updated_at" not in columns:
+            # Время записи состояния диалога появилось позже; столбец
+            # могла уже добавить другая реплика
+            try:
+                conn.execute("ALTER TABLE conversations ADD COLUMN updated_at REAL")
+            except sqlite3.OperationalError:
+                pass
+
+    def _read_connection(self):
+        # Файл и схему к этому времени уже создало основное соединение
+        # при загрузке данных в Application.initialize()
+        if self._reader is None:
+            self._reader = sqlite3.connect(
+                f"{pathlib.Path(self.filepath).absolute().as_uri()}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+                isolation_level=None,
+            )
+        return self._reader
+
+    async def _run(self, func, *args):
+        def call():
+            with self._lock:
+                return func(self._connection(), *args)
+
+        return await asyncio.to_thread(call)
+
+    def _check_external_changes(self, conn):
+        """Сбросить признаки свежести, если с прошлой проверки писала другая реплика."""
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._bot_data_fresh = False
+            self._fresh_users = set()
+            self._fresh_chats = set()
+
+    def _transaction(self, conn, statements):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            statements(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _import_legacy_pickle(self):
+        path = self.legacy_pickle_path
+        if not path or not os.path.isfile(path):
+            return
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.error(f"Не удалось прочитать {path} для переноса в SQLite: {e}")
+            return
+
+        def statements(conn):
+            self._write_bot_data(conn, data.get("bot_data") or {})
+            for user_id, user_data in (data.get("user_data") or {}).items():
+                conn.execute(
+                    "INSERT OR REPLACE INTO user_data VALUES (?, ?)",
+                    (user_id, _dump(user_data)),
+                )
+            for chat_id, chat_data in (data.get("chat_data") or {}).items():
+                conn.execute(
+                    "INSERT OR REPLACE INTO chat_data VALUES (?, ?)",
+                    (chat_id, _dump(chat_data)),
+                )
+            for name, states in (data.get("conversations") or {}).items():
+                for key, state in states.items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO conversations (name, key, state) "
+                        "VALUES (?, ?, ?)",
+                        (name, json.dumps(list(key)), _dump(state)),
+                    )
+            if data.get("callback_data") is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO callback_data VALUES (0, ?)",
+                    (_dump(data["callback_data"]),),
+                )
+
+        self._transaction(self._conn, statements)
+        logger.info(f"Данные из {path} перенесены в {self.filepath}")
+
+    def _write_bot_data(self, conn, data, removed=(), previous=None):
+        previous = previous or {}
+        for key, value in data.items():
+            if key == STATE_KEY:
+                _write_request_state(conn, value, previous.get(STATE_KEY) or {})
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO bot_data VALUES (?, ?)", (key, _dump(value))
+                )
+        for key in removed:
+            if key == STATE_KEY:
+                conn.execute("DELETE FROM request_state")
+                conn.execute("DELETE FROM request_messages")
+            else:
+                conn.execute("DELETE FROM bot_data WHERE key = ?", (key,))
+
+    # --- bot_data ---
+
+    def _read_bot_data(self, conn):
+        data = {
+            key: pickle.loads(value)
+            for key, value in conn.execute("SELECT key, value FROM bot_data")
+        }
+        entries = _load_request_state(conn)
+        if entries:
+            data[STATE_KEY] = entries
+        return data
+
+    async def get_bot_data(self):
+        def load(conn):
+            self._check_external_changes(conn)
+            data = self._read_bot_data(conn)
+            self._bot_data_snapshot = copy.deepcopy(data)
+            self._bot_data_fresh = True
+            return data
+
+        return await self._run(load)
+
+    async def update_bot_data(self, data) -> None:
+        # Приложение передает сюда свежую копию bot_data, поэтому ее можно
+        # сохранить как снимок без повторного копирования
+        def save(conn):
+            snapshot = self._bot_data_snapshot
+            changed = {
+                key: value
+                for key, value in data.items()
+                if key not in snapshot or snapshot[key] != value
+            }
+            removed = [key for key in snapshot if key not in data]
+            if not changed and not removed:
+                return
+            self._transaction(
+                conn, lambda c: self._write_bot_data(c, changed, removed, snapshot)
+            )
+            self._bot_data_snapshot = data
+
+        await self._run(save)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        def load(conn):
+            self._check_external_changes(conn)
+            if self._bot_data_fresh:
+                return _UNCHANGED
+            self._bot_data_fresh = True
+            return self._read_bot_data(conn)
+
+        stored = await self._run(load)
+        if stored is _UNCHANGED:
+            return
+        snapshot = self._bot_data_snapshot
+        # Реестр заявок сливается по заявкам, остальные ключи — целиком
+        local_state = bot_data.get(STATE_KEY)
+        if isinstance(local_state, dict):
+            state_snapshot = _merge(
+                local_state, stored.pop(STATE_KEY, {}), snapshot.pop(STATE_KEY, {})
+            )
+            new_snapshot = _merge(bot_data, stored, snapshot)
+            new_snapshot[STATE_KEY] = state_snapshot
+        else:
+            new_snapshot = _merge(bot_data, stored, snapshot)
+        self._bot_data_snapshot = new_snapshot
+
+    # --- user_data / chat_data ---
+
+    async def get_user_data(self):
+        def load(conn):
+            self._check_external_changes(conn)
+            self._fresh_users = None
+            rows = conn.execute("SELECT user_id, data FROM user_data")
+            return {user_id: pickle.loads(data) for user_id, data in rows}
+
+        return await self._run(load)
+
+    async def update_user_data(self, user_id: int, data) -> None:
+        def save(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO user_data VALUES (?, ?)", (user_id, _dump(data))
+            )
+            if self._fresh_users is not None:
+                self._fresh_users.add(user_id)
+
+        await self._run(save)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "DELETE FROM user_data WHERE user_id = ?", (user_id,)
+            )
+        )
+
+    async def refresh_user_data(self, user_id: int, user_data) -> None:
+        stored = await self._run(self._load_if_stale, "user_data", "user_id", user_id)
+        if stored is not _UNCHANGED:
+            user_data.clear()
+            user_data.update(stored)
+
+    async def get_chat_data(self):
+        def load(conn):
+            self._check_external_changes(conn)
+            self._fresh_chats = None
+            rows = conn.execute("SELECT chat_id, data FROM chat_data")
+            return {chat_id: pickle.loads(data) for chat_id, data in rows}
+
+        return await self._run(load)
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        def save(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_data VALUES (?, ?)", (chat_id, _dump(data))
+            )
+            if self._fresh_chats is not None:
+                self._fresh_chats.add(chat_id)
+
+        await self._run(save)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "DELETE FROM chat_data WHERE chat_id = ?", (chat_id,)
+            )
+        )
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        stored = await self._run(self._load_if_stale, "chat_data", "chat_id", chat_id)
+        if stored is not _UNCHANGED:
+            chat_data.clear()
+            chat_data.update(stored)
+
+    def _load_if_stale(self, conn, table, id_column, row_id):
+        """Прочитать данные пользователя или чата, если их могла изменить другая реплика."""
+        self._check_external_changes(conn)
+        fresh = self._fresh_users if table == "user_data" else self._fresh_chats
+        if fresh is None or row_id in fresh:
+            return _UNCHANGED
+        fresh.add(row_id)
+        row = conn.execute(
+            f"SELECT data FROM {table} WHERE {id_column} = ?", (row_id,)
+        ).fetchone()
+        return pickle.loads(row[0]) if row else _UNCHANGED
+
+    # --- conversations / callback_data ---
+
+    async def get_conversations(self, name: str):
+        def load(conn):
+            rows = conn.execute(
+                "SELECT key, state FROM conversations WHERE name = ?", (name,)
+            )
+            return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+        return await self._run(load)
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        def save(conn):
+            if new_state is None:
+                conn.execute(
+                    "DELETE FROM conversations WHERE name = ? AND key = ?",
+                    (name, json.dumps(list(key))),
+                )
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?)",
+                    (name, json.dumps(list(key)), _dump(new_state), time.time()),
+                )
+
+        await self._run(save)
+
+    async def load_conversation(self, name: str, key):
+        """Состояние диалога в хранилище и время его записи: (state, updated_at).
+
+        Для диалога, которого в хранилище нет, возвращает (None, None).
+        """
+
+        def load():
+            with self._reader_lock:
+                row = (
+                    self._read_connection()
+                    .execute(
+                        "SELECT state, updated_at FROM conversations "
+                        "WHERE name = ? AND key = ?",
+                        (name, json.dumps(list(key))),
+                    )
+                    .fetchone()
+                )
+            return (pickle.loads(row[0]), row[1]) if row else (None, None)
+
+        return await asyncio.to_thread(load)
+
+    async def drop_expired_conversations(self, name: str, timeout: float):
+        """Удалить состояния диалога, записанные раньше чем timeout секунд назад.
+
+        Таймауты диалогов не сохраняются, поэтому после перезапуска брошенный
+        диалог иначе остался бы открытым навсегда. Состояния без времени
+        записи (из прежних версий) тоже удаляются. Возвращает ключи удаленных.
+        """
+
+        def drop(conn):
+            expired = []
+
+            def statements(c):
+                rows = c.execute(
+                    "SELECT key FROM conversations WHERE name = ? "
+                    "AND (updated_at IS NULL OR updated_at < ?)",
+                    (name, time.time() - timeout),
+                ).fetchall()
+                c.executemany(
+                    "DELETE FROM conversations WHERE name = ? AND key = ?",
+                    [(name, key) for key, in rows],
+                )
+                expired.extend(tuple(json.loads(key)) for key, in rows)
+
+            self._transaction(conn, statements)
+            return expired
+
+        return await self._run(drop)
+
+    async def get_callback_data(self):
+        def load(conn):
+            row = conn.execute("SELECT data FROM callback_data WHERE id = 0").fetchone()
+            return pickle.loads(row[0]) if row else None
+
+        return await self._run(load)
+
+    async def update_callback_data(self, data) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO callback_data VALUES (0, ?)", (_dump(data),)
+            )
+        )
+
+    # --- блокировки между репликами ---
+
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """Взять блокировку name, если она свободна или ее срок истек."""
+
+        def acquire(conn):
+            now = time.time()
+            acquired = []
+
+            def statements(c):
+                c.execute(
+                    "INSERT INTO locks VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE "
+                    "SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE locks.expires_at < ?",
+                    (name, owner, now + ttl, now),
+                )
+                row = c.execute("SELECT owner FROM locks WHERE name = ?", (name,)).fetchone()
+                acquired.append(row[0] == owner)
+
+            self._transaction(conn, statements)
+            return acquired[0]
+
+        return await self._run(acquire)
+
+    async def release_lock(self, name: str, owner: str) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner)
+            )
+        )
+
+    async def flush(self) -> None:
+        with self._reader_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -1,123 +1,150 @@
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List
 
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, JobQueue
 
-import sheets
-from handlers.helpers import get_user_mention, escape_markdown
+import metrics
+import request_state
+import sheets_async
+from config import SHARED_STATE
+from handlers.helpers import escape_markdown
+from shared_state import hold_lock
 
 logger = logging.getLogger(__name__)
 
+# Первое напоминание — через 30 минут после взятия заявки, затем каждые 30 минут
+REMINDER_INTERVAL = timedelta(minutes=30)
+
+
+def _job_name(request_id: str) -> str:
+    return f"reminder_{request_id}"
+
+
+def _cancel_reminder(job_queue: JobQueue, request_id: str):
+    for job in job_queue.get_jobs_by_name(_job_name(request_id)):
+        job.schedule_removal()
+
+
+def schedule_reminder(job_queue: JobQueue, request_id: str, tracking_data: dict):
+    """Запланировать напоминания по заявке на ближайшую 30-минутную отметку"""
+    _cancel_reminder(job_queue, request_id)
+    last_mark = tracking_data.get("last_reminder_time") or tracking_data["claim_time"]
+    first = max(last_mark + REMINDER_INTERVAL - datetime.now(), timedelta(0))
+    job_queue.run_repeating(
+        send_reminder,
+        interval=REMINDER_INTERVAL,
+        first=first,
+        name=_job_name(request_id),
+        data=request_id,
+    )
+
 
 def track_request_claim_time(context: ContextTypes.DEFAULT_TYPE, request_id: str, engineer_id: int):
-    """Сохранить время взятия заявки в работу"""
-    claim_time = datetime.now()
-    context.bot_data[f"claim_time_{request_id}"] = {
+    """Сохранить время взятия заявки в работу и запланировать напоминания"""
+    tracking_data = {
         "engineer_id": engineer_id,
-        "claim_time": claim_time,
+        "claim_time": datetime.now(),
         "last_reminder_time": None  # Время последнего отправленного напоминания
     }
+    request_state.set_claim(context.bot_data, request_id, tracking_data)
+    schedule_reminder(context.job_queue, request_id, tracking_data)
     logger.info(f"Отслеживание времени для заявки {request_id}, инженер {engineer_id}")
 
 
 def cleanup_request_tracking(context: ContextTypes.DEFAULT_TYPE, request_id: str):
     """Очистить данные отслеживания заявки при ее завершении"""
-    key = f"claim_time_{request_id}"
-    if key in context.bot_data:
-        del context.bot_data[key]
+    _cancel_reminder(context.job_queue, request_id)
+    entry = request_state.get(context.bot_data, request_id)
+    if entry and entry["claim"]:
+        entry["claim"] = None
         logger.info(f"Очищены данные отслеживания для заявки {request_id}")
 
 
-async def check_and_send_reminders(context: ContextTypes.DEFAULT_TYPE):
-    """Проверить заявки в работе и отправить напоминания при необходимости"""
-    current_time = datetime.now()
-    reminder_threshold = timedelta(minutes=30)  # Изменено с 1 часа на 30 минут
-    
-    # Получаем все заявки в работе
-    in_progress_requests = sheets.get_requests_by_status("В работе")
-    
-    if not in_progress_requests:
-        logger.debug("Нет заявок в работе для проверки напоминаний")
-        return
-    
-    reminders_sent = 0
-    
-    for request in in_progress_requests:
-        request_id = str(request.get("id", ""))
-        if not request_id:
-            continue
-            
-        tracking_key = f"claim_time_{request_id}"
-        tracking_data = context.bot_data.get(tracking_key)
-        
+@metrics.instrument_job
+async def restore_reminders(context: ContextTypes.DEFAULT_TYPE):
+    """Восстановить задачи напоминаний из сохраненных данных после перезапуска"""
+    restored = 0
+    for request_id, entry in request_state.items(context.bot_data):
+        tracking_data = entry["claim"]
         if not tracking_data:
-            # Если нет данных отслеживания, возможно заявка была взята до внедрения системы
-            logger.debug(f"Нет данных отслеживания для заявки {request_id}")
             continue
-            
-        engineer_id = tracking_data.get("engineer_id")
-        claim_time = tracking_data.get("claim_time")
-        last_reminder_time = tracking_data.get("last_reminder_time")
-        
-        if not engineer_id or not claim_time:
+        if not tracking_data.get("engineer_id") or not tracking_data.get("claim_time"):
             continue
-            
-        # Проверяем, нужно ли отправить напоминание
-        should_send_reminder = False
-        
+        schedule_reminder(context.job_queue, request_id, tracking_data)
+        restored += 1
+    logger.info(f"Восстановлено напоминаний по заявкам: {restored}")
+
+
+@metrics.instrument_job
+async def send_reminder(context: ContextTypes.DEFAULT_TYPE):
+    """Отправить инженеру напоминание о незакрытой заявке"""
+    request_id = context.job.data
+    # Задача напоминания может стоять сразу в нескольких репликах бота —
+    # напоминание отправляет та, что первой возьмет блокировку
+    async with hold_lock(context.application, f"reminder_{request_id}") as locked:
+        if locked:
+            await _send_reminder(context, request_id)
+
+
+async def _send_reminder(context: ContextTypes.DEFAULT_TYPE, request_id: str):
+    await context.refresh_data()
+    tracking_data = request_state.get_claim(context.bot_data, request_id)
+    if not tracking_data:
+        context.job.schedule_removal()
+        return
+
+    request = await sheets_async.get_request(request_id, priority=sheets_async.BACKGROUND)
+    if request and request.get("Статус") != "В работе":
+        # Заявку закрыли в обход бота — напоминать больше не о чем
+        cleanup_request_tracking(context, request_id)
+        return
+    request = request or {}
+
+    current_time = datetime.now()
+    engineer_id = tracking_data["engineer_id"]
+    claim_time = tracking_data["claim_time"]
+    last_reminder_time = tracking_data.get("last_reminder_time")
+    if current_time - (last_reminder_time or claim_time) < REMINDER_INTERVAL / 2:
+        # Другая реплика уже напомнила на этой отметке
+        return
+
+    try:
+        exhibit_name = request.get("Экспонат", "Неизвестно")
+        problem = request.get("Проблема", "")
+
+        # Определяем текст напоминания в зависимости от того, первое это напоминание или повторное
         if last_reminder_time is None:
-            # Первое напоминание - проверяем, прошло ли 30 минут с момента взятия заявки
-            time_since_claim = current_time - claim_time
-            if time_since_claim >= reminder_threshold:
-                should_send_reminder = True
+            time_text = "более 30 минут назад"
         else:
-            # Повторное напоминание - проверяем, прошло ли 30 минут с последнего напоминания
-            time_since_last_reminder = current_time - last_reminder_time
-            if time_since_last_reminder >= reminder_threshold:
-                should_send_reminder = True
-        
-        if should_send_reminder:
-            # Отправляем напоминание
-            try:
-                exhibit_name = request.get("Экспонат", "Неизвестно")
-                problem = request.get("Проблема", "")
-                
-                # Определяем текст напоминания в зависимости от того, первое это напоминание или повторное
-                if last_reminder_time is None:
-                    time_text = "более 30 минут назад"
-                else:
-                    time_since_claim = current_time - claim_time
-                    hours = int(time_since_claim.total_seconds() // 3600)
-                    minutes = int((time_since_claim.total_seconds() % 3600) // 60)
-                    if hours > 0:
-                        time_text = f"более {hours} ч {minutes} мин назад"
-                    else:
-                        time_text = f"более {minutes} мин назад"
-                
-                reminder_text = (
-                    f"⏰ *Напоминание о заявке*\n\n"
-                    f"Вы взяли в работу заявку \\#{escape_markdown(request_id)} "
-                    f"{escape_markdown(time_text)}\\.\n\n"
-                    f"🏛 *Экспонат:* {escape_markdown(exhibit_name)}\n"
-                    f"🔧 *Проблема:* {escape_markdown(problem)}\n\n"
-                    f"Пожалуйста, не забудьте завершить заявку после решения проблемы\\!"
-                )
-                
-                await context.bot.send_message(
-                    chat_id=engineer_id,
-                    text=reminder_text,
-                    parse_mode="MarkdownV2"
-                )
-                
-                # Обновляем время последнего напоминания
-                context.bot_data[tracking_key]["last_reminder_time"] = current_time
-                reminders_sent += 1
-                
-                logger.info(f"Отправлено напоминание инженеру {engineer_id} о заявке {request_id}")
-                
-            except Exception as e:
-                logger.error(f"Ошибка отправки напоминания инженеру {engineer_id} о заявке {request_id}: {e}")
-    
-    if reminders_sent > 0:
-        logger.info(f"Отправлено {reminders_sent} напоминаний инженерам")
\ No newline at end of file
+            time_since_claim = current_time - claim_time
+            hours = int(time_since_claim.total_seconds() // 3600)
+            minutes = int((time_since_claim.total_seconds() % 3600) // 60)
+            if hours > 0:
+                time_text = f"более {hours} ч {minutes} мин назад"
+            else:
+                time_text = f"более {minutes} мин назад"
+
+        reminder_text = (
+            f"⏰ *Напоминание о заявке*\n\n"
+            f"Вы взяли в работу заявку \\#{escape_markdown(request_id)} "
+            f"{escape_markdown(time_text)}\\.\n\n"
+            f"🏛 *Экспонат:* {escape_markdown(exhibit_name)}\n"
+            f"🔧 *Проблема:* {escape_markdown(problem)}\n\n"
+            f"Пожалуйста, не забудьте завершить заявку после решения проблемы\\!"
+        )
+
+        await context.bot.send_message(
+            chat_id=engineer_id,
+            text=reminder_text,
+            parse_mode="MarkdownV2"
+        )
+
+        # Обновляем время последнего напоминания (это же продлевает жизнь записи)
+        tracking_data["last_reminder_time"] = current_time
+        request_state.touch(context.bot_data, request_id)
+        if SHARED_STATE:
+            await context.application.update_persistence()
+        logger.info(f"Отправлено напоминание инженеру {engineer_id} о заявке {request_id}")
+
+    except Exception as e:
+        logger.error(f"Ошибка отправки напоминания инженеру {engineer_id} о заявке {request_id}: {e}")
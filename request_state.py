@@ -0,0 +1,90 @@
+"""Реестр состояния заявок в bot_data.
+
+Все, что бот помнит о заявке между обновлениями (автор, сообщения в чате
+инженеров, время взятия в работу), хранится в одной записи
+bot_data["request_state"][request_id]. У каждой записи есть срок жизни:
+каждое обращение его продлевает, а периодическая задача удаляет просроченные
+записи, чтобы bot_data не рос бесконечно.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from config import REQUEST_STATE_TTL_DAYS
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = "request_state"
+STATE_TTL = timedelta(days=REQUEST_STATE_TTL_DAYS)
+
+
+def _new_entry():
+    return {"author_id": None, "messages": [], "claim": None, "expires_at": None}
+
+
+def get(bot_data, request_id):
+    return bot_data.get(STATE_KEY, {}).get(str(request_id))
+
+
+def touch(bot_data, request_id):
+    """Получить (или создать) запись заявки и продлить срок ее жизни."""
+    entry = bot_data.setdefault(STATE_KEY, {}).setdefault(str(request_id), _new_entry())
+    entry["expires_at"] = datetime.now() + STATE_TTL
+    return entry
+
+
+def items(bot_data):
+    return list(bot_data.get(STATE_KEY, {}).items())
+
+
+def forget(bot_data, request_id):
+    return bot_data.get(STATE_KEY, {}).pop(str(request_id), None)
+
+
+def set_author(bot_data, request_id, user_id: int):
+    touch(bot_data, request_id)["author_id"] = user_id
+
+
+def get_author(bot_data, request_id):
+    entry = get(bot_data, request_id)
+    return entry["author_id"] if entry else None
+
+
+def add_message(bot_data, request_id, chat_id: int, message_id: int):
+    touch(bot_data, request_id)["messages"].append((chat_id, message_id))
+
+
+def set_claim(bot_data, request_id, claim: dict):
+    touch(bot_data, request_id)["claim"] = claim
+
+
+def get_claim(bot_data, request_id):
+    entry = get(bot_data, request_id)
+    return entry["claim"] if entry else None
+
+
+def is_expired(entry, now=None) -> bool:
+    return entry["expires_at"] is not None and entry["expires_at"] <= (
+        now or datetime.now()
+    )
+
+
+def migrate_legacy_keys(bot_data) -> int:
+    """Перенести плоские ключи прежних версий (req_{id}_author и т.п.) в реестр."""
+    migrated = 0
+    for key in list(bot_data):
+        if not isinstance(key, str):
+            continue
+        if key.startswith("req_") and key.endswith("_author"):
+            set_author(bot_data, key[len("req_") : -len("_author")], bot_data.pop(key))
+        elif key.startswith("messages_for_req_"):
+            request_id = key[len("messages_for_req_") :]
+            touch(bot_data, request_id)["messages"].extend(bot_data.pop(key))
+        elif key.startswith("claim_time_"):
+            set_claim(bot_data, key[len("claim_time_") :], bot_data.pop(key))
+        else:
+            continue
+        migrated += 1
+    if migrated:
+        logger.info(f"Перенесено старых ключей bot_data в реестр заявок: {migrated}")
+    return migrated
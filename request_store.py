@@ -0,0 +1,238 @@
+import threading
+import time
+from datetime import datetime
+
+STATUS_COLUMN = "Статус"
+COMPLETED_AT_COLUMN = "Время завершения"
+COMPLETED_STATUS = "Завершена"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEMONSTRATOR_COLUMN = "demonstrator_username"
+ID_COLUMN = "id"
+# Столбцы листа «Заявки»; нужны, пока лист недоступен и заголовок не прочитан
+REQUESTS_HEADER = (
+    "id",
+    "Время создания",
+    "Время завершения",
+    "Статус",
+    "Экспонат",
+    "Проблема",
+    "demonstrator_username",
+    "engineer_username",
+    "Ответственный",
+    "Комментарий",
+)
+
+
+class _Row:
+    """Строка листа: значения ячеек кортежем в порядке столбцов заголовка."""
+
+    __slots__ = ("values", "row_number", "position")
+
+    def __init__(self, values, row_number, position):
+        self.values = values
+        self.row_number = row_number
+        self.position = position
+
+
+class RequestStore:
+    """Копия листа «Заявки» в памяти с индексами по id, статусу и демонстратору.
+
+    Строки хранятся компактными кортежами, а словари в формате
+    get_all_records() собираются только для заявок, попавших в выборку.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._header = ()
+        self._columns = {}
+        self._rows = {}
+        self._next_position = 0
+        self._by_status = {}
+        self._by_demonstrator = {}
+        # Локальные изменения, которые нужно наложить поверх снимка листа,
+        # если они произошли, пока снимок загружался
+        self._seq = 0
+        self._changes = []
+        self.loaded_at = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    @property
+    def header(self):
+        return self._header
+
+    def begin_sync(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def load(self, values, since_seq=None):
+        """Заменить содержимое снимком листа (результат get_all_values)."""
+        with self._lock:
+            self._header = tuple(values[0]) if values else ()
+            self._columns = {name: index for index, name in enumerate(self._header)}
+            self._rows = {}
+            self._next_position = 0
+            self._by_status = {}
+            self._by_demonstrator = {}
+            # Первая строка листа — заголовок, данные начинаются со второй
+            for row_number, row in enumerate(values[1:], start=2):
+                self._insert(row, row_number)
+
+            if since_seq is not None:
+                self._changes = [ch for ch in self._changes if ch[0] > since_seq]
+                for _, kind, payload in self._changes:
+                    if kind == "add":
+                        self._insert(*payload)
+                    else:
+                        self._apply_update(*payload)
+            else:
+                self._changes = []
+            self.loaded_at = time.monotonic()
+
+    def get(self, request_id):
+        with self._lock:
+            row = self._rows.get(str(request_id))
+            return self._record(row) if row else None
+
+    def cells(self, request_id):
+        """Значения ячеек заявки в порядке столбцов листа."""
+        with self._lock:
+            row = self._rows.get(str(request_id))
+            return row.values if row else None
+
+    def row_number(self, request_id):
+        """Номер строки листа, в которой лежит заявка."""
+        with self._lock:
+            row = self._rows.get(str(request_id))
+            return row.row_number if row else None
+
+    def max_numeric_id(self):
+        with self._lock:
+            numeric = [int(i) for i in self._rows if i.isdigit()]
+            return max(numeric, default=0)
+
+    def dump(self):
+        """Заголовок и строки в порядке листа — формат get_all_values()."""
+        with self._lock:
+            rows = sorted(self._rows.values(), key=lambda row: row.position)
+            return [list(self._header)] + [list(row.values) for row in rows]
+
+    def all(self):
+        """Все заявки в порядке строк листа."""
+        with self._lock:
+            return self._collect(self._rows)
+
+    def by_status(self, status):
+        with self._lock:
+            return self._collect(self._by_status.get(status, ()))
+
+    def by_demonstrator(self, demonstrator_username):
+        with self._lock:
+            return self._collect(self._by_demonstrator.get(demonstrator_username, ()))
+
+    def completed_before(self, cutoff: datetime):
+        """Заявки, завершенные раньше cutoff: [(id, значения, номер строки)]."""
+        with self._lock:
+            result = []
+            for request_id in self._by_status.get(COMPLETED_STATUS, ()):
+                row = self._rows[request_id]
+                try:
+                    completed_at = datetime.strptime(
+                        str(self._field(row.values, COMPLETED_AT_COLUMN)).strip(),
+                        TIME_FORMAT,
+                    )
+                except ValueError:
+                    continue
+                if completed_at < cutoff:
+                    result.append((request_id, row.values, row.row_number))
+            return sorted(result, key=lambda item: item[2])
+
+    def add(self, row, row_number=None):
+        with self._lock:
+            if row_number is None:
+                row_number = (
+                    max((r.row_number for r in self._rows.values()), default=1) + 1
+                )
+            self._record_change("add", (tuple(row), row_number))
+            self._insert(row, row_number)
+
+    def update(self, request_id, columns):
+        """Обновить ячейки заявки; columns — {номер столбца (с 1): значение}."""
+        with self._lock:
+            self._record_change("update", (str(request_id), dict(columns)))
+            self._apply_update(str(request_id), columns)
+
+    def compare_and_set(self, request_id, expected, columns):
+        """Обновить ячейки заявки, только если ее поля совпадают с expected.
+
+        expected и columns — {номер столбца (с 1): значение}. Возвращает True,
+        если обновление применено, False — если поля не совпали, None — если
+        заявки нет в кэше.
+        """
+        with self._lock:
+            row = self._rows.get(str(request_id))
+            if row is None:
+                return None
+            for column, value in expected.items():
+                if not 0 < column <= len(row.values) or row.values[column - 1] != value:
+                    return False
+            self._record_change("update", (str(request_id), dict(columns)))
+            self._apply_update(str(request_id), columns)
+            return True
+
+    def _record_change(self, kind, payload):
+        self._seq += 1
+        self._changes.append((self._seq, kind, payload))
+
+    def _record(self, row):
+        return dict(zip(self._header, row.values))
+
+    def _field(self, values, column):
+        index = self._columns.get(column)
+        return values[index] if index is not None else None
+
+    def _collect(self, ids):
+        rows = sorted((self._rows[i] for i in ids), key=lambda row: row.position)
+        return [self._record(row) for row in rows]
+
+    def _insert(self, row, row_number):
+        width = len(self._header)
+        values = tuple(row[:width]) + ("",) * (width - len(row))
+        request_id = str(self._field(values, ID_COLUMN) or "").strip()
+        if not request_id:
+            return
+        existing = self._rows.get(request_id)
+        if existing:
+            self._unindex(request_id, existing.values)
+            existing.values = values
+            existing.row_number = row_number
+        else:
+            self._rows[request_id] = _Row(values, row_number, self._next_position)
+            self._next_position += 1
+        self._index(request_id, values)
+
+    def _apply_update(self, request_id, columns):
+        row = self._rows.get(request_id)
+        if row is None:
+            return
+        values = list(row.values)
+        for column, value in columns.items():
+            if 0 < column <= len(values):
+                values[column - 1] = value
+        self._unindex(request_id, row.values)
+        row.values = tuple(values)
+        self._index(request_id, row.values)
+
+    def _index(self, request_id, values):
+        status = self._field(values, STATUS_COLUMN)
+        demonstrator = self._field(values, DEMONSTRATOR_COLUMN)
+        self._by_status.setdefault(status, set()).add(request_id)
+        self._by_demonstrator.setdefault(demonstrator, set()).add(request_id)
+
+    def _unindex(self, request_id, values):
+        status = self._field(values, STATUS_COLUMN)
+        demonstrator = self._field(values, DEMONSTRATOR_COLUMN)
+        self._by_status.get(status, set()).discard(request_id)
+        self._by_demonstrator.get(demonstrator, set()).discard(request_id)
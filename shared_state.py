@@ -0,0 +1,180 @@
+"""Работа нескольких реплик бота с общим хранилищем.
+
+Реплики за одним вебхуком делят файл SQLitePersistence на общем томе.
+Чтобы каждая видела изменения остальных сразу, а не через update_interval:
+
+- после каждого апдейта данные бота сбрасываются в хранилище
+  (persist_after_update);
+- перед обработкой апдейта состояние диалогов сверяется с хранилищем
+  (sync_conversations, SharedConversationHandler);
+- напоминания отправляются под блокировкой, общей для всех реплик (hold_lock).
+
+Изменения заявок реплики делят через общий журнал (journal.py).
+"""
+
+import asyncio
+import contextlib
+import datetime
+import logging
+import os
+import socket
+import time
+import uuid
+
+from telegram import Update
+from telegram.ext import ContextTypes, ConversationHandler
+
+from config import SHARED_LOCK_TIMEOUT, SHARED_LOCK_TTL
+
+logger = logging.getLogger(__name__)
+
+# В контейнерах у всех реплик pid 1, поэтому добавляем случайный суффикс
+REPLICA_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Внутри процесса блокировки по именам сводятся к фиксированному набору,
+# чтобы словарь не рос с числом заявок
+_LOCAL_STRIPES = 64
+_local_locks = [asyncio.Lock() for _ in range(_LOCAL_STRIPES)]
+
+
+@contextlib.asynccontextmanager
+async def hold_lock(application, name: str, timeout=SHARED_LOCK_TIMEOUT, ttl=SHARED_LOCK_TTL):
+    """Удерживать блокировку name во всех репликах; отдает True, если она взята.
+
+    Если хранилище не поддерживает блокировки (или его нет), действует только
+    блокировка внутри процесса.
+    """
+    persistence = application.persistence
+    async with _local_locks[hash(name) % _LOCAL_STRIPES]:
+        if not hasattr(persistence, "acquire_lock"):
+            yield True
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = 0.05
+        acquired = await persistence.acquire_lock(name, REPLICA_ID, ttl)
+        while not acquired and loop.time() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+            acquired = await persistence.acquire_lock(name, REPLICA_ID, ttl)
+        if not acquired:
+            logger.warning(f"Не удалось взять блокировку {name} за {timeout} с")
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                await persistence.release_lock(name, REPLICA_ID)
+
+
+async def persist_after_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сразу записать изменения данных бота, чтобы их увидели другие реплики."""
+    await context.application.update_persistence()
+
+
+class SharedConversationHandler(ConversationHandler):
+    """ConversationHandler, который принимает состояние диалога из общего хранилища.
+
+    Состояние подтягивает sync_conversations; без SHARED_STATE ведет себя как
+    обычный ConversationHandler.
+
+    Таймаут диалога не сохраняется в хранилище. Поэтому состояние, записанное
+    раньше conversation_timeout, считается завершенным: после перезапуска или
+    на другой реплике диалог не остается открытым навсегда.
+    """
+
+    @property
+    def timeout_seconds(self):
+        timeout = self.conversation_timeout
+        if isinstance(timeout, datetime.timedelta):
+            return timeout.total_seconds()
+        return timeout
+
+    def is_expired(self, updated_at) -> bool:
+        """Истек ли таймаут у состояния, записанного в updated_at (time.time())."""
+        timeout = self.timeout_seconds
+        if not timeout:
+            return False
+        return updated_at is None or time.time() - updated_at > timeout
+
+    def conversation_key(self, update: Update):
+        """Ключ диалога, как его строит ConversationHandler, или None."""
+        chat, user = update.effective_chat, update.effective_user
+        key = []
+        if self.per_chat:
+            if chat is None:
+                return None
+            key.append(chat.id)
+        if self.per_user:
+            if user is None:
+                return None
+            key.append(user.id)
+        if self.per_message:
+            query = update.callback_query
+            if query is None:
+                return None
+            key.append(query.inline_message_id or query.message.message_id)
+        return tuple(key)
+
+    def apply_stored_state(self, key, state):
+        # Публичного способа сменить состояние у ConversationHandler нет,
+        # поэтому версия python-telegram-bot закреплена в requirements.txt
+        current = self._conversations.get(key)
+        # Неблокирующий обработчик еще работает — его результат важнее
+        if state == current or hasattr(current, "resolve"):
+            return
+        # Без отметки об изменении: это уже записанное состояние
+        if state is None or state == self.END:
+            self._conversations.data.pop(key, None)
+        else:
+            self._conversations.update_no_track({key: state})
+
+
+def _shared_handlers(application):
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, SharedConversationHandler) and handler.persistent:
+                yield handler
+
+
+async def sync_conversations(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сверить состояние диалогов с хранилищем до того, как апдейт их проверит.
+
+    Регистрируется в группе -1. Хранилище читается в пуле потоков отдельным
+    соединением, поэтому запись другой реплики не останавливает цикл событий.
+    """
+    application = context.application
+    store = application.persistence
+    if not hasattr(store, "load_conversation"):
+        return
+    for handler in _shared_handlers(application):
+        key = handler.conversation_key(update)
+        if key is None:
+            continue
+        try:
+            state, updated_at = await store.load_conversation(handler.name, key)
+        except Exception as e:
+            logger.debug(f"Состояние диалога {handler.name} не сверено: {e}")
+            continue
+        if state is not None and handler.is_expired(updated_at):
+            state = None
+        handler.apply_stored_state(key, state)
+
+
+async def drop_expired_conversations(application):
+    """Закрыть диалоги, таймаут которых истек, пока бот не работал.
+
+    Вызывается из post_init: таймауты не переживают перезапуск, и без этого
+    следующее сообщение пользователя попало бы в давно брошенный диалог.
+    """
+    store = application.persistence
+    if not hasattr(store, "drop_expired_conversations"):
+        return
+    for handler in _shared_handlers(application):
+        timeout = handler.timeout_seconds
+        if not timeout:
+            continue
+        expired = await store.drop_expired_conversations(handler.name, timeout)
+        for key in expired:
+            handler.apply_stored_state(key, None)
+        if expired:
+            logger.info(f"Закрыто диалогов {handler.name} с истекшим таймаутом: {len(expired)}")
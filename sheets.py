@@ -1,71 +1,126 @@
+import hashlib
+import json
 import logging
-import uuid
-from datetime import datetime
+import re
+import time
+from datetime import datetime, timedelta
 
 import gspread
-import pandas as pd
-from oauth2client.service_account import ServiceAccountCredentials
 
-from config import GSHEETS_CREDENTIALS_FILE, GSHEETS_TABLE_NAME, SHEET_NAMES
+import metrics
+import sheets_quota
+from config import (
+    REQUEST_ID_FILE,
+    REQUEST_JOURNAL_FILE,
+    REQUESTS_RECONCILE_INTERVAL,
+    SHEET_NAMES,
+    SHEETS_RECONNECT_INTERVAL,
+)
+from id_allocator import RequestIdAllocator
+from journal import RequestJournal
+from locks import SharedExclusiveLock
+from request_store import REQUESTS_HEADER, TIME_FORMAT, RequestStore
+from sheets_backend import get_backend
+from sheets_connection import SheetsConnection
+from stats import RequestStats
 
 logger = logging.getLogger(__name__)
 
-try:
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(
-        GSHEETS_CREDENTIALS_FILE, scope
-    )
-    client = gspread.authorize(creds)
-    workbook = client.open(GSHEETS_TABLE_NAME)
-except Exception as e:
-    logger.error(f"Критическая ошибка подключения к Google Sheets: {e}")
-    workbook = None
+
+def _wrap_workbook(book):
+    # Сначала квота и повторы, под ними — замер каждого отдельного запроса
+    return sheets_quota.QuotaAwareApi(metrics.InstrumentedApi(book))
+
+
+# Книга открывается при первом обращении; пока связи нет, заявки копятся
+# в журнале
+_connection = SheetsConnection(get_backend, _wrap_workbook, SHEETS_RECONNECT_INTERVAL)
+
+
+def use_workbook(book):
+    """Подключить открытую книгу (gspread или FakeWorkbook)."""
+    _connection.use(book)
+
+
+def maintain_connection() -> bool:
+    """Подключиться к таблице, если связи нет, и заранее обновить токен."""
+    return _connection.maintain()
+
+
+def is_connected() -> bool:
+    return _connection.is_connected
+
+
+# Заявки читаются из таблицы (или снимка журнала) один раз и дальше
+# обслуживаются из памяти; периодическая сверка с листом — reload_requests()
+_requests = RequestStore()
+# Изменения заявок сначала попадают в журнал, а в таблицу их переносит
+# sync_journal()
+_journal = RequestJournal(REQUEST_JOURNAL_FILE)
+# Сколько событий журнала переносить в таблицу за раз и через сколько новых
+# событий обновлять снимок кэша
+JOURNAL_BATCH = 200
+JOURNAL_SNAPSHOT_EVERY = 200
+# offline — кэш собран только из журнала, потому что таблица была недоступна
+_journal_state = {"snapshot_seq": 0, "offline": False}
+# Номера строк листа «Заявки» по id для переноса журнала и отметка, при
+# которой они прочитаны. Столбец A перечитывается, только если лист мог
+# измениться в обход этой реплики: журнал переносила другая реплика или
+# архив удалил строки
+_sheet_index = {"rows": None}
+# Записи по номеру строки держат блокировку совместно, перенос в архив,
+# удаляющий строки, — монопольно
+_row_layout = SharedExclusiveLock()
+# Заявки с листа «Архив»; читаются по требованию для истории /myrequests
+_archive = RequestStore()
+# Сколько непрерывных диапазонов строк удалять за один перенос в архив
+ARCHIVE_MAX_RANGES = 20
+# Агрегаты для /stats; обновляются при каждой смене статуса заявки
+_stats = RequestStats()
+_request_ids = RequestIdAllocator(REQUEST_ID_FILE)
+# Telegram ID инженера -> имя; заполняется при каждом чтении листа «Инженеры»
+_engineer_names = None
+# Отпечаток последней загруженной версии листов «Инженеры» и «Экспонаты»
+_reference_state = {"modified_time": None, "digest": None}
 
 
 def get_sheet(sheet_name_key):
-    if not workbook:
-        return None
     try:
-        return workbook.worksheet(SHEET_NAMES[sheet_name_key])
+        return _connection.worksheet(SHEET_NAMES[sheet_name_key])
     except gspread.exceptions.WorksheetNotFound:
         logger.error(f"Лист '{SHEET_NAMES[sheet_name_key]}' не найден!")
         return None
+    except Exception as e:
+        _connection.report_error(e)
+        logger.error(f"Не удалось открыть лист '{SHEET_NAMES[sheet_name_key]}': {e}")
+        return None
 
 
 def get_engineer_name_by_id(engineer_id: int):
-    sheet = get_sheet("engineers")
-    if not sheet:
-        return None
-    try:
-        cell = sheet.find(str(engineer_id))
-        return sheet.cell(cell.row, 1).value
-    except (gspread.exceptions.CellNotFound, AttributeError):
-        return None
+    if _engineer_names is None:
+        get_engineers()
+    return (_engineer_names or {}).get(int(engineer_id))
 
 
 def get_next_request_id():
-    sheet = get_sheet("requests")
-    if not sheet:
-        logger.error("Не удалось получить лист 'Заявки' для генерации ID.")
-        return None
-    try:
-        num_requests = len(sheet.get_all_records())
-        return num_requests + 1
-    except Exception as e:
-        logger.error(f"Ошибка при подсчете записей в таблице: {e}")
-        return None
+    if not _request_ids.is_seeded:
+        # Один раз за запуск сверяем счетчик с максимальным номером в таблице.
+        # Без таблицы номер берется только из файла счетчика: в кэше из
+        # журнала нет старых заявок
+        loaded = _load_requests() and not _journal_state["offline"]
+        max_id = _requests.max_numeric_id() if loaded else None
+        if not _request_ids.seed(max_id):
+            logger.error("Не удалось инициализировать счетчик номеров заявок.")
+            return None
+    return _request_ids.allocate()
 
 
 def add_new_request(demonstrator_username, exhibit, problem):
-    sheet = get_sheet("requests")
-    if not sheet:
+    if not _load_requests():
         return None
     request_id = get_next_request_id()
     if request_id is None:
-        request_id = str(uuid.uuid4())[:8]
+        return None
     start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     row = [
         str(request_id),
@@ -79,91 +134,639 @@ def add_new_request(demonstrator_username, exhibit, problem):
         "",
         "",
     ]
-    sheet.append_row(row)
+    try:
+        _commit({"type": "created", "id": str(request_id), "row": row})
+    except OSError as e:
+        logger.error(f"Не удалось записать в журнал заявку {request_id}: {e}")
+        return None
     return request_id
 
 
+def _appended_row_number(response):
+    try:
+        updated_range = response["updates"]["updatedRange"]
+        return int(re.search(r"!\$?[A-Z]+\$?(\d+)", updated_range).group(1))
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
 def update_request_status(
     request_id, new_status, engineer_username="", engineer_name="", comment=""
 ):
-    sheet = get_sheet("requests")
-    if not sheet:
+    if not _load_requests() or _requests.get(request_id) is None:
         return False
+    columns = {4: new_status}
+    kind = "status"
+    if new_status == "В работе":
+        kind = "claimed"
+        columns[8] = engineer_username
+        columns[9] = engineer_name
+    elif new_status == "Завершена":
+        kind = "completed"
+        columns[3] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        columns[10] = comment
     try:
-        cell = sheet.find(str(request_id))
-        row_number = cell.row
-        sheet.update_cell(row_number, 4, new_status)
-        if new_status == "В работе":
-            sheet.update_cell(row_number, 8, engineer_username)
-            sheet.update_cell(row_number, 9, engineer_name)
-        elif new_status == "Завершена":
-            end_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            sheet.update_cell(row_number, 3, end_time)
-            sheet.update_cell(row_number, 10, comment)
-        return True
-    except gspread.exceptions.CellNotFound:
+        _commit({"type": kind, "id": str(request_id), "columns": columns})
+    except OSError as e:
+        logger.error(f"Не удалось записать в журнал изменение заявки {request_id}: {e}")
         return False
+    return True
 
 
-def is_request_new(request_id: str) -> bool:
-    sheet = get_sheet("requests")
-    if not sheet:
-        return False
+def is_claim_cache_ready() -> bool:
+    """Можно ли разыграть взятие заявки в памяти, не обращаясь к таблице."""
+    return _requests.is_loaded and _engineer_names is not None
+
+
+def _claim_columns(engineer_id: int, engineer_username):
+    engineer_name = get_engineer_name_by_id(engineer_id) or engineer_username
+    return {4: "В работе", 8: engineer_username, 9: engineer_name}
+
+
+def try_claim(request_id, engineer_id: int, engineer_username):
+    """Взять заявку в кэше, если она еще новая.
+
+    Проверка и смена статуса атомарны, поэтому из одновременных нажатий
+    выигрывает ровно одно. Возвращает True, если заявка взята, False, если ее
+    уже взяли, и None, если заявки нет. В таблицу изменение записывает
+    write_claim().
+    """
+    if not _load_requests():
+        return None
+    return _requests.compare_and_set(
+        request_id, {4: "Новая"}, _claim_columns(engineer_id, engineer_username)
+    )
+
+
+def write_claim(request_id, engineer_id: int, engineer_username):
+    """Записать в журнал взятие заявки, уже отмеченное в кэше try_claim().
+
+    Перед записью дочитываются события других реплик: если заявку успели
+    взять там, взятие не записывается. Возвращает True при успехе, False,
+    если заявку уже взяли, None при ошибке.
+    """
+    columns = _claim_columns(engineer_id, engineer_username)
+
+    def still_ours():
+        if _requests.compare_and_set(
+            request_id, {4: "В работе", 8: engineer_username}, columns
+        ):
+            return True
+        # Сверка с листом могла заменить кэш снимком, сделанным до взятия
+        return bool(_requests.compare_and_set(request_id, {4: "Новая"}, columns))
+
     try:
-        cell = sheet.find(str(request_id))
-        if not cell:
-            return False
-        status = sheet.cell(cell.row, 4).value
-        return status.strip().lower() == "новая"
-    except (gspread.exceptions.CellNotFound, AttributeError) as e:
-        logger.error(f"Ошибка при проверке статуса заявки {request_id}: {e}")
-        return False
+        event = _commit(
+            {"type": "claimed", "id": str(request_id), "columns": columns},
+            check=still_ours,
+        )
+    except OSError as e:
+        logger.error(f"Не удалось записать в журнал взятие заявки {request_id}: {e}")
+        return None
+    return event is not None
+
+
+def release_claim(request_id, engineer_username):
+    """Откатить в кэше взятие заявки, которое не удалось записать в таблицу."""
+    return bool(
+        _requests.compare_and_set(
+            request_id,
+            {4: "В работе", 8: engineer_username},
+            {4: "Новая", 8: "", 9: ""},
+        )
+    )
+
+
+def is_request_new(request_id: str) -> bool:
+    request = get_request(request_id)
+    return bool(request) and str(request.get("Статус")).strip().lower() == "новая"
 
 
 def get_engineers():
     sheet = get_sheet("engineers")
     if not sheet:
         return []
-    records = sheet.get_all_records()
-    return [
-        int(record["Telegram ID"])
-        for record in records
-        if record.get("Telegram ID") and str(record["Telegram ID"]).isdigit()
-    ]
+    return _parse_engineers(sheet.get_all_values())
+
+
+def _parse_engineers(values):
+    global _engineer_names
+    header = values[0] if values else []
+    if "Telegram ID" not in header:
+        _engineer_names = {}
+        return []
+    id_column = header.index("Telegram ID")
+    names = {}
+    for row in values[1:]:
+        telegram_id = row[id_column].strip() if id_column < len(row) else ""
+        if telegram_id.isdigit():
+            names[int(telegram_id)] = row[0]
+    _engineer_names = names
+    return list(names)
 
 
 def get_content():
     sheet = get_sheet("content")
     if not sheet:
         return {}
-    records = sheet.get_all_records()
+    return _parse_content(sheet.get_all_values())
+
+
+def _parse_content(values):
+    header = values[0] if values else []
     content = {}
-    for row in records:
-        exhibit_name = row.get("Экспонат")
+    for row in values[1:]:
+        record = dict(zip(header, row))
+        exhibit_name = record.get("Экспонат")
         if not exhibit_name:
             continue
         problems = [
-            value for key, value in row.items() if key.startswith("Проблема") and value
+            value
+            for key, value in record.items()
+            if key.startswith("Проблема") and value
         ]
         content[exhibit_name] = problems
     return content
 
 
-def get_requests_by_status(status):
+def _get_modified_time(workbook):
+    try:
+        return workbook.get_lastUpdateTime()
+    except Exception as e:
+        logger.warning(f"Не удалось получить время изменения таблицы: {e}")
+        return None
+
+
+def fetch_reference_data(force=False):
+    """Вернуть (engineers, content), если справочные листы изменились, иначе None.
+
+    Сначала сверяется время изменения таблицы (один легкий запрос к Drive API);
+    если оно сдвинулось, оба листа читаются одним запросом и сравниваются
+    по хэшу содержимого.
+    """
+    workbook = _connection.workbook()
+    if workbook is None:
+        return None
+    modified_time = _get_modified_time(workbook)
+    if (
+        not force
+        and modified_time is not None
+        and modified_time == _reference_state["modified_time"]
+    ):
+        return None
+    try:
+        response = workbook.values_batch_get(
+            [SHEET_NAMES["engineers"], SHEET_NAMES["content"]]
+        )
+    except Exception as e:
+        _connection.report_error(e)
+        logger.error(f"Не удалось загрузить справочные листы: {e}")
+        return None
+    engineers_values, content_values = (
+        value_range.get("values", []) for value_range in response["valueRanges"]
+    )
+    digest = hashlib.sha256(
+        json.dumps([engineers_values, content_values], ensure_ascii=False).encode()
+    ).hexdigest()
+    _reference_state["modified_time"] = modified_time
+    if not force and digest == _reference_state["digest"]:
+        return None
+    _reference_state["digest"] = digest
+    return _parse_engineers(engineers_values), _parse_content(content_values)
+
+
+def _load_requests(force=False):
+    if _requests.is_loaded and not force:
+        return True
+    if not force and _restore_snapshot():
+        return True
     sheet = get_sheet("requests")
-    if not sheet:
+    values = None
+    if sheet:
+        since_seq = _requests.begin_sync()
+        # События, перенесенные в таблицу позже этой отметки, могли не попасть
+        # в прочитанный снимок листа — их накладываем поверх
+        replicated_seq = _journal.replicated_seq
+        token = _sheet_token()
+        try:
+            values = sheet.get_all_values()
+        except Exception as e:
+            _connection.report_error(e)
+            logger.error(f"Не удалось загрузить заявки из таблицы: {e}")
+    if values is None:
+        return not force and _load_offline()
+    # Заголовок прочитан вместе с данными — запоминаем его для переноса журнала
+    _connection.remember_columns(SHEET_NAMES["requests"], values[0] if values else [])
+    _sheet_index["rows"] = (_index_rows(values), token)
+    with _journal.locked():
+        _requests.load(values, since_seq)
+        for event in _journal.pending(replicated_seq):
+            _apply_event(event)
+    _journal_state["offline"] = False
+    return True
+
+
+def _load_offline():
+    """Собрать кэш заявок из одного журнала, пока таблица недоступна.
+
+    Заявок, которые уже были только в таблице, в таком кэше нет; лист
+    перечитывается, как только связь восстановится (sync_journal).
+    """
+    with _journal.locked():
+        _requests.load([list(REQUESTS_HEADER)])
+        for event in _journal.pending(0):
+            _apply_event(event)
+    _journal_state["offline"] = True
+    logger.warning("Google Sheets недоступна: заявки обслуживаются из журнала")
+    return True
+
+
+def _restore_snapshot():
+    """Восстановить кэш заявок из снимка и событий журнала после него."""
+    snapshot = _journal.load_snapshot()
+    if not snapshot:
+        return False
+    with _journal.locked():
+        _requests.load(snapshot["values"])
+        for event in _journal.pending(snapshot["seq"]):
+            _apply_event(event)
+    _journal_state["snapshot_seq"] = snapshot["seq"]
+    logger.info(
+        f"Кэш заявок восстановлен из снимка журнала (событие {snapshot['seq']}, "
+        f"после него — {_journal.last_seq - snapshot['seq']})"
+    )
+    return True
+
+
+def _apply_event(event):
+    if event["type"] == "created":
+        _requests.add(event["row"])
+    else:
+        columns = {int(column): value for column, value in event["columns"].items()}
+        _requests.update(event["id"], columns)
+
+
+def _track_event(event):
+    request = _requests.get(event["id"])
+    if request is None:
+        return
+    if event["type"] == "created":
+        _stats.on_created(request)
+    elif event["type"] == "claimed":
+        _stats.on_claimed(request, datetime.strptime(event["at"], TIME_FORMAT))
+    elif event["type"] == "completed":
+        _stats.on_completed(request)
+
+
+def _catch_up(events):
+    """Применить к кэшу события других реплик, дочитанные из журнала."""
+    for event in events:
+        _apply_event(event)
+        _track_event(event)
+
+
+def _commit(event, check=None):
+    """Записать событие в журнал и применить его к кэшу заявок.
+
+    check вызывается под блокировкой журнала после чужих событий; если он
+    вернул False, событие не записывается и возвращается None.
+    """
+    with _journal.locked() as foreign:
+        _catch_up(foreign)
+        if check is not None and not check():
+            return None
+        event = _journal.append(dict(event, at=datetime.now().strftime(TIME_FORMAT)))
+        _apply_event(event)
+    _track_event(event)
+    return event
+
+
+def sync_journal(snapshot=False):
+    """Перенести в лист «Заявки» события журнала, которых там еще нет.
+
+    Заодно дочитывает события других реплик и обновляет снимок кэша.
+    Возвращает число перенесенных событий или None, если таблица недоступна.
+    """
+    with _journal.locked() as foreign:
+        _catch_up(foreign)
+    if _journal_state["offline"] and reload_requests():
+        logger.info("Связь с Google Sheets восстановлена, кэш заявок перечитан")
+    if _journal.gap:
+        # Пропущенные события уже в таблице — перечитываем ее
+        _journal.gap = False
+        logger.warning("Журнал заявок сжат другой репликой, кэш перечитывается")
+        _load_requests(force=True)
+    _journal.forget_until(_journal.replicated_seq)
+    replicated = _replicate_journal()
+    due = _journal.last_seq - _journal_state["snapshot_seq"] >= JOURNAL_SNAPSHOT_EVERY
+    # Снимок неполного кэша из журнала заменил бы при запуске чтение листа
+    if _requests.is_loaded and not _journal_state["offline"] and (due or snapshot):
+        _write_snapshot()
+    metrics.journal_backlog.set(journal_backlog())
+    metrics.journal_backlog_age.set(journal_backlog_age())
+    return replicated
+
+
+def _replicate_journal():
+    with _journal.replicator() as acquired:
+        # Журнал переносит одна реплика; остальные только читают
+        if not acquired:
+            return 0
+        events = _journal.pending(_journal.replicated_seq)[:JOURNAL_BATCH]
+        if not events:
+            return 0
+        sheet = get_sheet("requests")
+        if not sheet:
+            return None
+        try:
+            moved = _moved_columns()
+            if moved:
+                logger.error(
+                    f"На листе «Заявки» переставлены столбцы: {', '.join(moved)}. "
+                    "Перенос журнала остановлен, чтобы не записать значения не туда"
+                )
+                return None
+            with _row_layout.shared():
+                rows = _write_events(sheet, events)
+        except Exception as e:
+            # Ошибки API и обрывы связи: события останутся в журнале до
+            # следующего переноса. Часть строк могла добавиться — номера
+            # строк перечитаем
+            _sheet_index["rows"] = None
+            _connection.report_error(e)
+            logger.error(f"Не удалось перенести журнал заявок в таблицу: {e}")
+            return None
+        _journal.mark_replicated(events[-1]["seq"])
+        # Отметку сдвинула эта реплика, и новые строки в индексе уже учтены
+        _sheet_index["rows"] = (rows, _sheet_token())
+        return len(events)
+
+
+def _moved_columns():
+    """Столбцы, стоящие на листе не там, куда события журнала пишут по номеру."""
+    columns = _connection.columns(SHEET_NAMES["requests"])
+    if not columns:
         return []
-    df = pd.DataFrame(sheet.get_all_records())
-    if df.empty or "Статус" not in df.columns:
+    return [
+        name
+        for number, name in enumerate(REQUESTS_HEADER, start=1)
+        if columns.get(name) != number
+    ]
+
+
+def _sheet_token():
+    return _journal.replicated_seq, _journal.layout_version
+
+
+def _index_rows(values):
+    """Номера строк по id заявки из первого столбца (строки get_all_values или A:A)."""
+    rows = {}
+    for row_number, cells in enumerate(values, start=1):
+        if cells and str(cells[0]).strip():
+            rows.setdefault(str(cells[0]).strip(), row_number)
+    return rows
+
+
+def _sheet_rows(sheet, refresh=False):
+    """Номера строк листа по id заявки; столбец A читается, только если индекс устарел."""
+    token = _sheet_token()
+    cached = _sheet_index["rows"]
+    if not refresh and cached is not None and cached[1] == token:
+        return cached[0]
+    rows = _index_rows(sheet.get("A:A"))
+    _sheet_index["rows"] = (rows, token)
+    return rows
+
+
+def _write_events(sheet, events):
+    """Записать события на лист; возвращает индекс строк с добавленными заявками."""
+    # Номера строк берем из индекса листа, а не из кэша: новые заявки, еще не
+    # перенесенные в таблицу, в кэше пронумерованы условно
+    rows = _sheet_rows(sheet)
+    # Заявку, добавленную прошлым прерванным переносом, не дублируем
+    created = {}
+    for event in events:
+        if event["type"] == "created" and event["id"] not in rows:
+            created.setdefault(event["id"], event["row"])
+    if created:
+        first = _appended_row_number(sheet.append_rows(list(created.values())))
+        if first is None:
+            rows = _sheet_rows(sheet, refresh=True)
+        else:
+            for offset, request_id in enumerate(created):
+                rows[request_id] = first + offset
+
+    updated = [event for event in events if event["type"] != "created"]
+    if any(event["id"] not in rows for event in updated):
+        # Строку могли добавить вручную после чтения индекса
+        rows = _sheet_rows(sheet, refresh=True)
+    cells = {}
+    for event in updated:
+        row_number = rows.get(event["id"])
+        if row_number is None:
+            logger.warning(f"Заявки {event['id']} нет на листе, изменение пропущено")
+            continue
+        for column, value in event["columns"].items():
+            cells[(row_number, int(column))] = value
+    if cells:
+        sheet.batch_update(
+            [
+                {
+                    "range": gspread.utils.rowcol_to_a1(row_number, column),
+                    "values": [[value]],
+                }
+                for (row_number, column), value in cells.items()
+            ],
+            value_input_option="USER_ENTERED",
+        )
+    return rows
+
+
+def _write_snapshot():
+    with _journal.locked() as foreign:
+        _catch_up(foreign)
+        seq = _journal.last_seq
+        _journal.write_snapshot({"seq": seq, "values": _requests.dump()})
+        # События до снимка, уже перенесенные в таблицу, больше не нужны
+        _journal.compact(min(seq, _journal.replicated_seq))
+    _journal_state["snapshot_seq"] = seq
+
+
+def journal_backlog() -> int:
+    """Сколько событий журнала еще не перенесено в таблицу."""
+    return _journal.last_seq - _journal.replicated_seq
+
+
+def journal_backlog_age() -> float:
+    """Сколько секунд ждет переноса в таблицу самое старое событие журнала."""
+    pending = _journal.pending(_journal.replicated_seq)
+    if not pending:
+        return 0.0
+    oldest = datetime.strptime(pending[0]["at"], TIME_FORMAT)
+    return max((datetime.now() - oldest).total_seconds(), 0.0)
+
+
+def reload_requests():
+    """Сверить кэш заявок с листом «Заявки»."""
+    if not _load_requests(force=True):
+        return False
+    # В таблице могли появиться правки вручную и изменения других реплик
+    if _stats.is_bootstrapped:
+        _rebuild_stats()
+    return True
+
+
+def _rebuild_stats():
+    records = {}
+    if _load_archive():
+        records.update((req["id"], req) for req in _archive.all())
+    records.update((req["id"], req) for req in _requests.all())
+    _stats.rebuild(records.values())
+
+
+def is_stats_ready() -> bool:
+    return _stats.is_bootstrapped
+
+
+def get_stats():
+    """Сводка для /stats; при первом вызове собирается из всей истории."""
+    if not _stats.is_bootstrapped:
+        if not _load_requests():
+            return None
+        _rebuild_stats()
+    return _stats.snapshot()
+
+
+def get_request(request_id):
+    if not _load_requests():
+        return None
+    return _requests.get(request_id)
+
+
+def get_requests_by_status(status):
+    if not _load_requests():
         return []
-    return df[df["Статус"] == status].to_dict("records")
+    return _requests.by_status(status)
 
 
 def get_requests_by_demonstrator(demonstrator_username: str):
+    if not _load_requests():
+        return []
+    current = _requests.by_demonstrator(demonstrator_username)
+    # Перенесенные в архив заявки старше оставшихся на листе и идут первыми
+    if not _load_archive():
+        return current
+    current_ids = {req["id"] for req in current}
+    archived = [
+        req
+        for req in _archive.by_demonstrator(demonstrator_username)
+        if req["id"] not in current_ids
+    ]
+    return archived + current
+
+
+def _get_archive_sheet(create=False):
+    columns = max(len(_requests.header), 1) if create else None
+    try:
+        return _connection.worksheet(SHEET_NAMES["archive"], create_columns=columns)
+    except gspread.exceptions.WorksheetNotFound:
+        return None
+
+
+def _load_archive(force=False):
+    # Другие реплики тоже переносят заявки, поэтому копия архива обновляется
+    # не реже сверки кэша заявок
+    fresh = (
+        _archive.is_loaded
+        and time.monotonic() - _archive.loaded_at < REQUESTS_RECONCILE_INTERVAL
+    )
+    if fresh and not force:
+        return True
+    try:
+        archive = _get_archive_sheet()
+        _archive.load(archive.get_all_values() if archive else [])
+    except Exception as e:
+        _connection.report_error(e)
+        logger.error(f"Не удалось загрузить архив заявок: {e}")
+        return _archive.is_loaded
+    return True
+
+
+def archive_completed_requests(older_than_days: int):
+    """Перенести заявки, завершенные раньше older_than_days дней назад, в архив.
+
+    Строки копируются на лист «Архив» одним запросом и затем удаляются
+    с листа «Заявки» по одному запросу на каждый непрерывный диапазон.
+    Пока идет удаление, перенос журнала в таблицу (на любой реплике) ждет,
+    поэтому за один вызов удаляется не больше ARCHIVE_MAX_RANGES диапазонов.
+    Возвращает пару
+    (число перенесенных заявок, остались ли еще) или None при ошибке.
+    """
     sheet = get_sheet("requests")
     if not sheet:
-        return []
-    df = pd.DataFrame(sheet.get_all_records())
-    if df.empty or "demonstrator_username" not in df.columns:
-        return []
-    return df[df["demonstrator_username"] == demonstrator_username].to_dict("records")
+        return None
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    # Перенос журнала пишет по номерам строк, а удаление их сдвигает: держим
+    # блокировку переноса общую для всех реплик. Порядок блокировок тот же,
+    # что в _replicate_journal
+    with _journal.replicator(wait=True), _row_layout.exclusive():
+        # Удаление идет по номерам строк, поэтому берем их из свежего снимка
+        if not _load_requests(force=True):
+            return None
+        candidates = _requests.completed_before(cutoff)
+        ranges = _row_ranges([row_number for _, _, row_number in candidates])
+        has_more = len(ranges) > ARCHIVE_MAX_RANGES
+        if has_more:
+            ranges = ranges[:ARCHIVE_MAX_RANGES]
+            candidates = [item for item in candidates if item[2] <= ranges[-1][1]]
+        if not candidates:
+            return 0, False
+        try:
+            archive = _get_archive_sheet(create=True)
+            if archive is None or not _load_archive(force=True):
+                return None
+            if not _archive.header:
+                archive.append_row(list(_requests.header))
+                _archive.load([list(_requests.header)])
+            # Строки, скопированные прошлым прерванным запуском, не дублируем
+            rows = [
+                list(values)
+                for request_id, values, _ in candidates
+                if _archive.get(request_id) is None
+            ]
+            if rows:
+                archive.append_rows(rows)
+                for row in rows:
+                    _archive.add(row)
+            expected = {row_number: request_id for request_id, _, row_number in candidates}
+            # Снизу вверх, чтобы удаление не сдвигало еще не удаленные строки
+            for start, end in reversed(ranges):
+                # Лист могли поправить вручную после чтения — удаляем, только
+                # если в диапазоне по-прежнему те же заявки
+                cells = sheet.get(f"A{start}:A{end}")
+                ids = [str(row[0]).strip() if row else "" for row in cells]
+                if ids != [expected[number] for number in range(start, end + 1)]:
+                    logger.warning(
+                        f"Строки {start}-{end} листа заявок изменились, перенос прерван"
+                    )
+                    return None
+                sheet.delete_rows(start, end)
+        except gspread.exceptions.APIError as e:
+            logger.error(f"Ошибка при переносе заявок в архив: {e}")
+            return None
+        finally:
+            # Строки сдвинулись: номера строк перечитывают все реплики
+            _journal.bump_layout()
+            _load_requests(force=True)
+    return len(candidates), has_more
+
+
+def _row_ranges(row_numbers):
+    """Свернуть отсортированные номера строк в непрерывные диапазоны."""
+    ranges = []
+    for row_number in row_numbers:
+        if ranges and ranges[-1][1] == row_number - 1:
+            ranges[-1][1] = row_number
+        else:
+            ranges.append([row_number, row_number])
+    return ranges
@@ -0,0 +1,224 @@
+"""Асинхронный фасад над sheets.py.
+
+gspread работает синхронно, поэтому каждый вызов выполняется в отдельном пуле
+потоков и не блокирует цикл событий бота. Число одновременных запросов
+ограничено, а зависший запрос на чтение прерывается по таймауту. Записи
+таймаут не прерывает: поток продолжил бы запись, а пользователь, получив
+ошибку, повторил бы действие и создал дубликат.
+
+Фоновые вызовы (периодические задачи) занимают не больше
+SHEETS_MAX_CONCURRENCY - 1 потоков, так что действиям пользователей всегда
+остается свободный поток; приоритет передается и в sheets_quota.
+"""
+
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import sheets
+import sheets_quota
+from config import SHEETS_MAX_CONCURRENCY, SHEETS_TIMEOUT
+from sheets_quota import BACKGROUND, INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=SHEETS_MAX_CONCURRENCY, thread_name_prefix="sheets"
+)
+# Записи в журнал заявок идут на локальный диск и не ждут очереди к таблице
+_journal_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="journal")
+# Семафоры создаются при первом вызове, уже внутри работающего цикла событий
+_pool_slots = None
+_background_slots = None
+
+
+def _get_slots(priority):
+    global _pool_slots, _background_slots
+    if _pool_slots is None:
+        _pool_slots = asyncio.Semaphore(SHEETS_MAX_CONCURRENCY)
+        _background_slots = asyncio.Semaphore(max(SHEETS_MAX_CONCURRENCY - 1, 1))
+    background = _background_slots if priority == BACKGROUND else contextlib.nullcontext()
+    return background, _pool_slots
+
+
+def _call_with_priority(priority, func, args, kwargs):
+    token = sheets_quota.priority.set(priority)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sheets_quota.priority.reset(token)
+
+
+async def run(
+    func,
+    *args,
+    default=None,
+    timeout=SHEETS_TIMEOUT,
+    priority=INTERACTIVE,
+    local=False,
+    **kwargs,
+):
+    """Выполнить синхронную функцию sheets в пуле потоков.
+
+    При превышении таймаута возвращает default, а функция продолжает
+    выполняться в потоке, поэтому для записей передается timeout=None.
+    Отмена вызывающей корутины снимает задачу из очереди пула, если она еще
+    не начала выполняться. С local функция выполняется в отдельном пуле
+    журнала заявок.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    if local:
+        background_slot = pool_slot = contextlib.nullcontext()
+    else:
+        background_slot, pool_slot = _get_slots(priority)
+    try:
+        async with background_slot, pool_slot:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                _journal_executor if local else _executor,
+                functools.partial(_call_with_priority, priority, func, args, kwargs),
+            )
+            try:
+                result = await asyncio.wait_for(future, timeout)
+                outcome = "ok"
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                logger.error(
+                    f"Превышено время ожидания Google Sheets ({timeout} с) в {func.__name__}"
+                )
+                result = default
+        return result
+    finally:
+        metrics.sheets_call_duration.observe(
+            time.perf_counter() - started, function=func.__name__, outcome=outcome
+        )
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _journal_executor.shutdown(wait=True)
+
+
+async def get_engineer_name_by_id(engineer_id: int):
+    return await run(sheets.get_engineer_name_by_id, engineer_id)
+
+
+async def add_new_request(demonstrator_username, exhibit, problem):
+    return await run(
+        sheets.add_new_request,
+        demonstrator_username,
+        exhibit,
+        problem,
+        timeout=None,
+        local=True,
+    )
+
+
+async def update_request_status(
+    request_id, new_status, engineer_username="", engineer_name="", comment=""
+):
+    return await run(
+        sheets.update_request_status,
+        request_id,
+        new_status,
+        engineer_username,
+        engineer_name,
+        comment,
+        default=False,
+        timeout=None,
+        local=True,
+    )
+
+
+async def is_request_new(request_id: str) -> bool:
+    return await run(sheets.is_request_new, request_id, default=False)
+
+
+async def try_claim(request_id, engineer_id: int, engineer_username):
+    # Когда кэш загружен, взятие разыгрывается в памяти без пула потоков,
+    # и ответ на нажатие не ждет очереди к таблице
+    if sheets.is_claim_cache_ready():
+        return sheets.try_claim(request_id, engineer_id, engineer_username)
+    # Взятие в памяти без таймаута: иначе оно состоялось бы после ответа
+    # «заявка не найдена» и осталось бы незаписанным
+    return await run(
+        sheets.try_claim, request_id, engineer_id, engineer_username, timeout=None
+    )
+
+
+async def write_claim(request_id, engineer_id: int, engineer_username):
+    return await run(
+        sheets.write_claim,
+        request_id,
+        engineer_id,
+        engineer_username,
+        timeout=None,
+        local=True,
+    )
+
+
+def release_claim(request_id, engineer_username):
+    return sheets.release_claim(request_id, engineer_username)
+
+
+async def maintain_connection():
+    return await run(sheets.maintain_connection, default=False, priority=BACKGROUND)
+
+
+async def sync_journal(snapshot=False):
+    return await run(
+        sheets.sync_journal, snapshot, timeout=None, priority=BACKGROUND
+    )
+
+
+async def get_engineers():
+    return await run(sheets.get_engineers, default=[])
+
+
+async def get_content():
+    return await run(sheets.get_content, default={})
+
+
+async def fetch_reference_data(force=False, priority=BACKGROUND):
+    return await run(sheets.fetch_reference_data, force, priority=priority)
+
+
+async def reload_requests(priority=BACKGROUND):
+    return await run(sheets.reload_requests, default=False, priority=priority)
+
+
+async def archive_completed_requests(older_than_days: int):
+    # Перенос ограничен числом удаляемых диапазонов и может идти дольше
+    # обычного запроса, поэтому таймаут не ставим
+    return await run(
+        sheets.archive_completed_requests,
+        older_than_days,
+        timeout=None,
+        priority=BACKGROUND,
+    )
+
+
+async def get_stats():
+    # Собранные агрегаты отдаются из памяти без пула потоков
+    if sheets.is_stats_ready():
+        return sheets.get_stats()
+    return await run(sheets.get_stats)
+
+
+async def get_request(request_id, priority=INTERACTIVE):
+    return await run(sheets.get_request, request_id, priority=priority)
+
+
+async def get_requests_by_status(status):
+    return await run(sheets.get_requests_by_status, status, default=[])
+
+
+async def get_requests_by_demonstrator(demonstrator_username: str):
+    return await run(
+        sheets.get_requests_by_demonstrator, demonstrator_username, default=[]
+    )
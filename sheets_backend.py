@@ -0,0 +1,300 @@
+"""Источники данных для sheets.py.
+
+GspreadBackend подключается к настоящей Google-таблице. FakeBackend держит
+листы в памяти и повторяет ту часть API gspread, которой пользуется бот,
+с настраиваемой задержкой и ошибками превышения квоты (HTTP 429) —
+для работы без сети и нагрузочного тестирования.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import gspread
+from gspread.cell import Cell
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+from requests import Response
+
+from config import (
+    GSHEETS_CREDENTIALS_FILE,
+    GSHEETS_TABLE_NAME,
+    SHEET_NAMES,
+    SHEETS_BACKEND,
+    SHEETS_FAKE_DATA,
+    SHEETS_FAKE_LATENCY,
+    SHEETS_FAKE_QUOTA_ERROR_RATE,
+)
+from request_store import REQUESTS_HEADER
+
+logger = logging.getLogger(__name__)
+
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive",
+]
+
+# Заголовки листов для пустой тестовой таблицы
+DEFAULT_FAKE_SHEETS = {
+    SHEET_NAMES["requests"]: [list(REQUESTS_HEADER)],
+    SHEET_NAMES["engineers"]: [["Имя", "Telegram ID"]],
+    SHEET_NAMES["content"]: [["Экспонат", "Проблема 1", "Проблема 2", "Проблема 3"]],
+}
+
+
+class GspreadBackend:
+    def __init__(self):
+        self._credentials = None
+
+    def open(self):
+        from google.oauth2.service_account import Credentials
+
+        self._credentials = Credentials.from_service_account_file(
+            GSHEETS_CREDENTIALS_FILE, scopes=SCOPE
+        )
+        client = gspread.authorize(self._credentials)
+        return client.open(GSHEETS_TABLE_NAME)
+
+    def refresh_credentials(self, margin: float) -> bool:
+        """Обновить токен доступа, если он истекает в ближайшие margin секунд."""
+        from google.auth.transport.requests import Request
+
+        credentials = self._credentials
+        if credentials is None:
+            return False
+        # google-auth хранит срок токена в UTC без часового пояса
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        expiry = credentials.expiry
+        if credentials.token and expiry and (expiry - now).total_seconds() > margin:
+            return False
+        credentials.refresh(Request())
+        return True
+
+
+def quota_error() -> gspread.exceptions.APIError:
+    """Ошибка в том виде, в каком gspread сообщает о превышении квоты."""
+    response = Response()
+    response.status_code = 429
+    response._content = json.dumps(
+        {
+            "error": {
+                "code": 429,
+                "message": "Quota exceeded for quota metric 'Read requests'",
+                "status": "RESOURCE_EXHAUSTED",
+            }
+        }
+    ).encode()
+    return gspread.exceptions.APIError(response)
+
+
+def _strip_sheet_name(a1_range: str) -> str:
+    return a1_range.split("!", 1)[1] if "!" in a1_range else a1_range
+
+
+class FakeWorksheet:
+    def __init__(self, workbook, title, rows):
+        self._workbook = workbook
+        self.title = title
+        self._rows = [list(row) for row in rows]
+
+    def _call(self, method):
+        self._workbook.simulate_request(method)
+
+    def _width(self):
+        return max((len(row) for row in self._rows), default=0)
+
+    def _set(self, row, col, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        cells = self._rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = "" if value is None else str(value)
+
+    def get_all_values(self):
+        self._call("get_all_values")
+        with self._workbook.lock:
+            return self._values()
+
+    def _values(self):
+        width = self._width()
+        return [row + [""] * (width - len(row)) for row in self._rows]
+
+    def get_all_records(self):
+        self._call("get_all_records")
+        with self._workbook.lock:
+            values = self._values()
+        if not values:
+            return []
+        return [dict(zip(values[0], row)) for row in values[1:]]
+
+    def get(self, a1_range):
+        self._call("get")
+        grid = a1_range_to_grid_range(_strip_sheet_name(a1_range))
+        with self._workbook.lock:
+            result = []
+            end_row = grid.get("endRowIndex", len(self._rows))
+            for row in self._rows[grid.get("startRowIndex", 0) : end_row]:
+                cells = row[grid.get("startColumnIndex", 0) : grid.get("endColumnIndex")]
+                while cells and cells[-1] == "":
+                    cells = cells[:-1]
+                result.append(list(cells))
+            while result and not result[-1]:
+                result.pop()
+            return result
+
+    def find(self, query):
+        self._call("find")
+        with self._workbook.lock:
+            for row_index, row in enumerate(self._rows, start=1):
+                for col_index, value in enumerate(row, start=1):
+                    if value == str(query):
+                        return Cell(row_index, col_index, value)
+        return None
+
+    def cell(self, row, col):
+        self._call("cell")
+        with self._workbook.lock:
+            cells = self._rows[row - 1] if row <= len(self._rows) else []
+            return Cell(row, col, cells[col - 1] if col <= len(cells) else "")
+
+    def update_cell(self, row, col, value):
+        self._call("update_cell")
+        with self._workbook.lock:
+            self._set(row, col, value)
+            self._workbook.touch()
+
+    def batch_update(self, data, value_input_option=None):
+        self._call("batch_update")
+        with self._workbook.lock:
+            for item in data:
+                grid = a1_range_to_grid_range(_strip_sheet_name(item["range"]))
+                for r, values in enumerate(item["values"]):
+                    for c, value in enumerate(values):
+                        self._set(
+                            grid["startRowIndex"] + r + 1,
+                            grid["startColumnIndex"] + c + 1,
+                            value,
+                        )
+            self._workbook.touch()
+
+    def append_rows(self, rows, value_input_option=None):
+        self._call("append_rows")
+        with self._workbook.lock:
+            first = len(self._rows) + 1
+            for row in rows:
+                self._rows.append(["" if v is None else str(v) for v in row])
+            self._workbook.touch()
+            last = len(self._rows)
+            width = max((len(row) for row in rows), default=1)
+        return {
+            "updates": {
+                "updatedRange": f"'{self.title}'!A{first}:{rowcol_to_a1(last, width)}"
+            }
+        }
+
+    def append_row(self, values, value_input_option=None):
+        return self.append_rows([values], value_input_option)
+
+    def delete_rows(self, start_index, end_index=None):
+        self._call("delete_rows")
+        with self._workbook.lock:
+            del self._rows[start_index - 1 : (end_index or start_index)]
+            self._workbook.touch()
+
+
+class FakeWorkbook:
+    def __init__(self, sheets, latency=0.0, quota_error_rate=0.0):
+        self.lock = threading.RLock()
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        # Сколько раз вызывался каждый метод API — для замеров
+        self.calls = Counter()
+        self._modified = datetime.now(timezone.utc)
+        self._worksheets = {
+            title: FakeWorksheet(self, title, rows) for title, rows in sheets.items()
+        }
+
+    def simulate_request(self, method):
+        with self.lock:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.quota_error_rate and random.random() < self.quota_error_rate:
+            raise quota_error()
+
+    def touch(self):
+        self._modified = datetime.now(timezone.utc)
+
+    def worksheet(self, title):
+        self.simulate_request("worksheet")
+        try:
+            return self._worksheets[title]
+        except KeyError:
+            raise gspread.exceptions.WorksheetNotFound(title) from None
+
+    def add_worksheet(self, title, rows=0, cols=0):
+        self.simulate_request("add_worksheet")
+        with self.lock:
+            self._worksheets[title] = FakeWorksheet(self, title, [])
+            return self._worksheets[title]
+
+    def values_batch_get(self, ranges):
+        self.simulate_request("values_batch_get")
+        with self.lock:
+            return {
+                "valueRanges": [
+                    {"range": name, "values": self._worksheets[name]._values()}
+                    for name in ranges
+                ]
+            }
+
+    def get_lastUpdateTime(self):
+        self.simulate_request("get_lastUpdateTime")
+        return self._modified.isoformat()
+
+
+class FakeBackend:
+    def __init__(self, sheets=None, latency=0.0, quota_error_rate=0.0):
+        self.sheets = sheets if sheets is not None else DEFAULT_FAKE_SHEETS
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self._workbook = None
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            sheets = dict(DEFAULT_FAKE_SHEETS, **json.load(f))
+        return cls(sheets, **kwargs)
+
+    def open(self):
+        # Книга создается один раз: переподключение не должно стирать данные
+        if self._workbook is None:
+            self._workbook = FakeWorkbook(self.sheets, self.latency, self.quota_error_rate)
+        return self._workbook
+
+    def refresh_credentials(self, margin: float) -> bool:
+        return False
+
+
+_fake_backend = None
+
+
+def get_backend():
+    global _fake_backend
+    if SHEETS_BACKEND == "fake":
+        # Один бэкенд на процесс: при переподключении открывается та же книга
+        if _fake_backend is None:
+            kwargs = {
+                "latency": SHEETS_FAKE_LATENCY,
+                "quota_error_rate": SHEETS_FAKE_QUOTA_ERROR_RATE,
+            }
+            if SHEETS_FAKE_DATA:
+                _fake_backend = FakeBackend.from_file(SHEETS_FAKE_DATA, **kwargs)
+            else:
+                _fake_backend = FakeBackend(**kwargs)
+        return _fake_backend
+    return GspreadBackend()
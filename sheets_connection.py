@@ -0,0 +1,176 @@
+"""Подключение к книге Google Sheets.
+
+Книга открывается не при импорте, а при первом обращении или в фоновой
+задаче (sheets.maintain_connection), поэтому запуск бота не ждет авторизации.
+Если подключиться не удалось или связь потеряна, попытки повторяются
+с нарастающей задержкой. Токен доступа обновляется заранее, до истечения,
+чтобы обновление не попадало на запросы пользователей.
+
+Открытые листы и их заголовки кэшируются до переподключения: обращение
+к листу не стоит отдельного запроса метаданных книги.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import gspread
+import requests
+from google.auth import exceptions as auth_exceptions
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY_MIN = 1.0
+# Токен обновляется, если до его истечения осталось меньше стольких секунд
+TOKEN_REFRESH_MARGIN = 300
+
+
+def is_connection_error(error) -> bool:
+    """Ошибка означает потерю связи или доступа, а не сбой отдельного запроса."""
+    if isinstance(
+        error,
+        (
+            requests.exceptions.ConnectionError,
+            auth_exceptions.TransportError,
+            auth_exceptions.RefreshError,
+        ),
+    ):
+        return True
+    response = getattr(error, "response", None)
+    return (
+        isinstance(error, gspread.exceptions.APIError)
+        and getattr(response, "status_code", None) == 401
+    )
+
+
+class SheetsConnection:
+    def __init__(self, backend_factory, wrap, max_delay: float):
+        """backend_factory возвращает бэкенд с методом open(), wrap оборачивает книгу."""
+        self._backend_factory = backend_factory
+        self._wrap = wrap
+        self._max_delay = max_delay
+        self._lock = threading.RLock()
+        self._backend = None
+        self._workbook = None
+        self._worksheets = {}
+        self._columns = {}
+        self._failures = 0
+        self._next_attempt = 0.0
+
+    @property
+    def is_connected(self) -> bool:
+        return self._workbook is not None
+
+    def use(self, book, backend=None):
+        """Подключить уже открытую книгу (loadtest.py и проверки на FakeBackend)."""
+        with self._lock:
+            self._backend = backend
+            self._failures = 0
+            self._reset(self._wrap(book))
+
+    def workbook(self):
+        """Открытая книга или None, если подключиться пока не удалось."""
+        workbook = self._workbook
+        if workbook is not None:
+            return workbook
+        with self._lock:
+            if self._workbook is None and time.monotonic() >= self._next_attempt:
+                self._connect()
+            return self._workbook
+
+    def worksheet(self, title, create_columns=None):
+        """Лист по названию или None без связи; с create_columns недостающий лист создается."""
+        sheet = self._worksheets.get(title)
+        if sheet is not None:
+            return sheet
+        workbook = self.workbook()
+        if workbook is None:
+            return None
+        try:
+            sheet = workbook.worksheet(title)
+        except gspread.exceptions.WorksheetNotFound:
+            if not create_columns:
+                raise
+            sheet = workbook.add_worksheet(title, rows=1, cols=create_columns)
+            logger.info(f"Создан лист '{title}'")
+        with self._lock:
+            # Пока лист открывался, подключение могло смениться
+            if self._workbook is workbook:
+                self._worksheets[title] = sheet
+        return sheet
+
+    def columns(self, title):
+        """Номера столбцов листа по заголовку: {название: номер с 1}."""
+        columns = self._columns.get(title)
+        if columns is None:
+            sheet = self.worksheet(title)
+            if sheet is None:
+                return None
+            rows = sheet.get("1:1")
+            columns = self.remember_columns(title, rows[0] if rows else [])
+        return columns
+
+    def remember_columns(self, title, header):
+        """Запомнить заголовок листа, уже прочитанный вместе с данными."""
+        columns = {name: index for index, name in enumerate(header, start=1) if name}
+        self._columns[title] = columns
+        return columns
+
+    def forget(self, title):
+        """Забыть лист и его заголовок — они будут прочитаны заново."""
+        with self._lock:
+            self._worksheets.pop(title, None)
+            self._columns.pop(title, None)
+
+    def report_error(self, error):
+        """Сбросить подключение, если ошибка означает потерю связи или доступа."""
+        if not is_connection_error(error):
+            return
+        with self._lock:
+            if self._workbook is None:
+                return
+            logger.warning(f"Связь с Google Sheets потеряна, подключаемся заново: {error}")
+            self._reset(None)
+            self._next_attempt = 0.0
+
+    def maintain(self) -> bool:
+        """Подключиться, если связи нет, и заранее обновить токен доступа."""
+        if self.workbook() is None:
+            return False
+        backend = self._backend
+        if backend is None:
+            return True
+        try:
+            if backend.refresh_credentials(TOKEN_REFRESH_MARGIN):
+                logger.info("Токен доступа к Google Sheets обновлен")
+        except Exception as e:
+            logger.error(f"Не удалось обновить токен доступа к Google Sheets: {e}")
+            self.report_error(e)
+            return False
+        return True
+
+    def _connect(self):
+        backend = self._backend_factory()
+        try:
+            book = backend.open()
+        except Exception as e:
+            self._failures += 1
+            delay = min(RECONNECT_DELAY_MIN * 2 ** (self._failures - 1), self._max_delay)
+            delay *= random.uniform(0.5, 1.0)
+            self._next_attempt = time.monotonic() + delay
+            logger.error(
+                f"Не удалось подключиться к Google Sheets (попытка {self._failures}, "
+                f"следующая через {delay:.0f} с): {e}"
+            )
+            return
+        if self._failures:
+            logger.info("Подключение к Google Sheets восстановлено")
+        self._backend = backend
+        self._failures = 0
+        self._reset(self._wrap(book))
+
+    def _reset(self, workbook):
+        self._workbook = workbook
+        self._worksheets = {}
+        self._columns = {}
@@ -0,0 +1,169 @@
+"""Соблюдение квот Google Sheets API на стороне клиента.
+
+Google ограничивает число запросов на чтение и запись в минуту и отвечает
+ошибкой 429 при превышении. Каждый запрос сначала получает жетон из ведра
+своего типа (чтение или запись), а при 429 и временных ошибках сервера
+повторяется с экспоненциальной задержкой.
+
+Запросы делятся на интерактивные (действия пользователей) и фоновые
+(периодические задачи). Фоновые не берут последние жетоны ведра и уступают
+очередь, если интерактивный запрос уже ждет.
+"""
+
+import contextvars
+import logging
+import random
+import threading
+import time
+
+import gspread
+
+import metrics
+from config import (
+    SHEETS_READ_QUOTA_PER_MINUTE,
+    SHEETS_RETRY_DEADLINE,
+    SHEETS_WRITE_QUOTA_PER_MINUTE,
+)
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Приоритет текущего вызова; выставляется в потоке пула sheets_async.run
+priority = contextvars.ContextVar("sheets_priority", default=INTERACTIVE)
+
+WRITE_METHODS = {
+    "append_row",
+    "append_rows",
+    "batch_update",
+    "update",
+    "update_cell",
+    "update_cells",
+    "delete_rows",
+    "add_worksheet",
+}
+# Запись этих методов можно безопасно повторить после ответа 5xx: повтор
+# перезапишет те же ячейки. Добавление строк при 5xx могло уже выполниться
+IDEMPOTENT_WRITES = {"batch_update", "update", "update_cell", "update_cells"}
+RETRYABLE_SERVER_ERRORS = {500, 502, 503, 504}
+
+# Доля ведра, которую фоновые запросы оставляют интерактивным
+BACKGROUND_RESERVE = 0.2
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 16.0
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = max(per_minute, 1)
+        self.rate = self.capacity / 60.0
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+        self._interactive_waiting = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _can_take(self, lane):
+        if lane == INTERACTIVE:
+            return self._tokens >= 1
+        reserve = self.capacity * BACKGROUND_RESERVE
+        return not self._interactive_waiting and self._tokens >= 1 + reserve
+
+    def acquire(self, lane=INTERACTIVE) -> float:
+        """Дождаться жетона; возвращает время ожидания в секундах."""
+        started = time.monotonic()
+        with self._condition:
+            if lane == INTERACTIVE:
+                self._interactive_waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    if self._can_take(lane):
+                        self._tokens -= 1
+                        return time.monotonic() - started
+                    missing = max(1 - self._tokens, 0.05)
+                    self._condition.wait(min(missing / self.rate, 1.0))
+            finally:
+                if lane == INTERACTIVE:
+                    self._interactive_waiting -= 1
+                    self._condition.notify_all()
+
+    def drain(self):
+        """Обнулить ведро после 429: Google уже считает квоту исчерпанной."""
+        with self._condition:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+
+_buckets = {
+    "read": TokenBucket(SHEETS_READ_QUOTA_PER_MINUTE),
+    "write": TokenBucket(SHEETS_WRITE_QUOTA_PER_MINUTE),
+}
+
+
+def _status(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _should_retry(method, status):
+    if status == 429:
+        return True
+    if status in RETRYABLE_SERVER_ERRORS:
+        return method not in WRITE_METHODS or method in IDEMPOTENT_WRITES
+    return False
+
+
+def call(method, func, *args, **kwargs):
+    """Выполнить запрос к API с учетом квоты и повторами."""
+    kind = "write" if method in WRITE_METHODS else "read"
+    lane = priority.get()
+    bucket = _buckets[kind]
+    deadline = time.monotonic() + SHEETS_RETRY_DEADLINE
+    attempt = 0
+    while True:
+        waited = bucket.acquire(lane)
+        metrics.sheets_quota_wait.observe(waited, kind=kind, lane=lane)
+        try:
+            return func(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            status = _status(e)
+            if not _should_retry(method, status):
+                raise
+            if status == 429:
+                bucket.drain()
+            delay = min(BACKOFF_BASE * 2**attempt, BACKOFF_MAX) * random.uniform(0.5, 1.0)
+            if time.monotonic() + delay > deadline:
+                raise
+            attempt += 1
+            metrics.sheets_api_retries.inc(method=method, status=status)
+            logger.warning(
+                f"Google Sheets ответил {status} на {method}, повтор {attempt} через {delay:.1f} с"
+            )
+            time.sleep(delay)
+
+
+class QuotaAwareApi:
+    """Обертка над книгой или листом gspread, пропускающая вызовы через call()."""
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            result = call(name, attr, *args, **kwargs)
+            if name in ("worksheet", "add_worksheet"):
+                return QuotaAwareApi(result)
+            return result
+
+        wrapper.__name__ = name
+        return wrapper
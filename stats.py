@@ -0,0 +1,174 @@
+"""Статистика работы с заявками для команды /stats.
+
+Агрегаты по экспонатам и инженерам (число заявок, время до взятия в работу
+и время устранения) обновляются при каждой смене статуса, поэтому /stats
+отвечает сразу, не перечитывая лист «Заявки». Из истории агрегаты
+собираются один раз — при первом обращении — и пересобираются после сверки
+кэша заявок с таблицей, чтобы учесть правки вручную и работу других реплик.
+
+Время взятия в таблице не хранится, поэтому время до взятия считается только
+по заявкам, взятым после запуска бота.
+"""
+
+import bisect
+import threading
+from datetime import datetime
+
+from request_store import COMPLETED_STATUS, TIME_FORMAT
+
+IN_PROGRESS_STATUS = "В работе"
+
+
+def _parse_time(value):
+    try:
+        return datetime.strptime(str(value).strip(), TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+class Durations:
+    """Длительности в секундах, отсортированные для точных процентилей."""
+
+    __slots__ = ("_values", "_total")
+
+    def __init__(self):
+        self._values = []
+        self._total = 0.0
+
+    def add(self, seconds: float):
+        bisect.insort(self._values, seconds)
+        self._total += seconds
+
+    @property
+    def count(self) -> int:
+        return len(self._values)
+
+    @property
+    def mean(self):
+        return self._total / len(self._values) if self._values else None
+
+    def percentile(self, q: float):
+        if not self._values:
+            return None
+        index = min(int(q * len(self._values)), len(self._values) - 1)
+        return self._values[index]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+        }
+
+
+def _exhibit_entry():
+    return {"total": 0, "open": 0, "claim": Durations(), "resolve": Durations()}
+
+
+def _engineer_entry():
+    return {
+        "name": "",
+        "in_progress": 0,
+        "done": 0,
+        "claim": Durations(),
+        "resolve": Durations(),
+    }
+
+
+def _summarize(entry):
+    return {
+        key: value.summary() if isinstance(value, Durations) else value
+        for key, value in entry.items()
+    }
+
+
+class RequestStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exhibits = {}
+        self._engineers = {}
+        self.is_bootstrapped = False
+
+    def rebuild(self, records):
+        """Пересобрать агрегаты по записям листа (заявки и архив).
+
+        Время до взятия из таблицы не восстановить, поэтому оно сохраняется.
+        """
+        exhibits, engineers = {}, {}
+        with self._lock:
+            for key, entry in self._exhibits.items():
+                exhibits.setdefault(key, _exhibit_entry())["claim"] = entry["claim"]
+            for key, entry in self._engineers.items():
+                engineers.setdefault(key, _engineer_entry())["claim"] = entry["claim"]
+            self._exhibits, self._engineers = exhibits, engineers
+            for record in records:
+                self._count_created(record)
+                status = record.get("Статус")
+                if status == IN_PROGRESS_STATUS:
+                    self._engineer(record)["in_progress"] += 1
+                elif status == COMPLETED_STATUS:
+                    self._count_completed(record)
+            self.is_bootstrapped = True
+
+    def on_created(self, record):
+        with self._lock:
+            if self.is_bootstrapped:
+                self._count_created(record)
+
+    def on_claimed(self, record, claimed_at: datetime):
+        with self._lock:
+            if not self.is_bootstrapped:
+                return
+            engineer = self._engineer(record)
+            engineer["in_progress"] += 1
+            created_at = _parse_time(record.get("Время создания"))
+            if created_at is not None:
+                waited = max((claimed_at - created_at).total_seconds(), 0.0)
+                self._exhibit(record)["claim"].add(waited)
+                engineer["claim"].add(waited)
+
+    def on_completed(self, record):
+        with self._lock:
+            if not self.is_bootstrapped:
+                return
+            engineer = self._engineer(record)
+            engineer["in_progress"] = max(engineer["in_progress"] - 1, 0)
+            exhibit = self._exhibit(record)
+            exhibit["open"] = max(exhibit["open"] - 1, 0)
+            self._count_completed(record)
+
+    def snapshot(self):
+        """Копия агрегатов; длительности заменены сводками Durations.summary()."""
+        with self._lock:
+            return {
+                "exhibits": {k: _summarize(v) for k, v in self._exhibits.items()},
+                "engineers": {k: _summarize(v) for k, v in self._engineers.items()},
+            }
+
+    def _exhibit(self, record):
+        key = record.get("Экспонат") or "—"
+        return self._exhibits.setdefault(key, _exhibit_entry())
+
+    def _engineer(self, record):
+        key = record.get("engineer_username") or "—"
+        entry = self._engineers.setdefault(key, _engineer_entry())
+        entry["name"] = record.get("Ответственный") or key
+        return entry
+
+    def _count_created(self, record):
+        exhibit = self._exhibit(record)
+        exhibit["total"] += 1
+        if record.get("Статус") != COMPLETED_STATUS:
+            exhibit["open"] += 1
+
+    def _count_completed(self, record):
+        exhibit = self._exhibit(record)
+        engineer = self._engineer(record)
+        engineer["done"] += 1
+        created_at = _parse_time(record.get("Время создания"))
+        completed_at = _parse_time(record.get("Время завершения"))
+        if created_at is not None and completed_at is not None:
+            resolved = max((completed_at - created_at).total_seconds(), 0.0)
+            exhibit["resolve"].add(resolved)
+            engineer["resolve"].add(resolved)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# config.py требует эти переменные при импорте; таблица — в памяти
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("ENGINEERS_CHAT_ID", "-1")
+os.environ.setdefault("GSHEETS_TABLE_NAME", "test")
+os.environ["SHEETS_BACKEND"] = "fake"
+os.environ["METRICS_PORT"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,66 @@
+"""Перенос журнала в таблицу: номера строк не перечитываются без нужды."""
+
+import copy
+import importlib
+
+import pytest
+
+import config
+from sheets_backend import DEFAULT_FAKE_SHEETS, FakeBackend
+
+OLD_COMPLETED = ["2020-01-01 10:00:00", "2020-01-02 10:00:00", "Завершена", "X", "P", "@d", "", "", ""]
+
+
+@pytest.fixture
+def workbook():
+    sheets = copy.deepcopy(DEFAULT_FAKE_SHEETS)
+    sheets[config.SHEET_NAMES["requests"]] += [[str(i)] + OLD_COMPLETED for i in (1, 2)]
+    return FakeBackend(sheets).open()
+
+
+@pytest.fixture
+def sheets(tmp_path, monkeypatch, workbook):
+    monkeypatch.setattr(config, "REQUEST_JOURNAL_FILE", str(tmp_path / "requests.journal"))
+    monkeypatch.setattr(config, "REQUEST_ID_FILE", str(tmp_path / "last_request_id"))
+    import sheets
+
+    sheets = importlib.reload(sheets)
+    sheets.use_workbook(workbook)
+    return sheets
+
+
+def _column(workbook, index):
+    rows = workbook.worksheet(config.SHEET_NAMES["requests"]).get_all_values()
+    return [row[index] for row in rows[1:]]
+
+
+def test_replication_reuses_row_index(sheets, workbook):
+    request_id = sheets.add_new_request("@demo", "Экспонат", "Проблема")
+    assert sheets.sync_journal() == 1
+    sheets.update_request_status(request_id, "Завершена", comment="ok")
+    assert sheets.sync_journal() == 1
+    # Индекс строк собран из get_all_values при загрузке кэша
+    assert workbook.calls.get("get", 0) == 0
+    assert _column(workbook, 3) == ["Завершена", "Завершена", "Завершена"]
+
+
+def test_archive_invalidates_row_index(sheets, workbook):
+    request_id = sheets.add_new_request("@demo", "Экспонат", "Проблема")
+    assert sheets.sync_journal() == 1
+    assert sheets.archive_completed_requests(30) == (2, False)
+    sheets.update_request_status(request_id, "В работе", "@eng", "Инженер")
+    assert sheets.sync_journal() == 1
+    assert _column(workbook, 0) == [str(request_id)]
+    assert _column(workbook, 3) == ["В работе"]
+
+
+def test_row_index_is_reread_after_layout_change_elsewhere(sheets, workbook):
+    first = sheets.add_new_request("@demo", "Экспонат", "Проблема")
+    assert sheets.sync_journal() == 1
+    # Другая реплика удалила строки и отметила это в журнале
+    workbook.worksheet(config.SHEET_NAMES["requests"]).delete_rows(2, 3)
+    sheets._journal.bump_layout()
+    sheets.update_request_status(first, "Завершена", comment="ok")
+    assert sheets.sync_journal() == 1
+    assert _column(workbook, 3) == ["Завершена"]
+    assert _column(workbook, 9) == ["ok"]
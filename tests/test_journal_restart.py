@@ -0,0 +1,68 @@
+"""Перезапуск бота: кэш заявок из снимка и журнала совпадает с таблицей."""
+
+import copy
+import importlib
+
+import pytest
+
+import config
+from sheets_backend import DEFAULT_FAKE_SHEETS, FakeBackend
+
+
+@pytest.fixture
+def workbook():
+    return FakeBackend(copy.deepcopy(DEFAULT_FAKE_SHEETS)).open()
+
+
+@pytest.fixture
+def start_bot(tmp_path, monkeypatch, workbook):
+    monkeypatch.setattr(config, "REQUEST_JOURNAL_FILE", str(tmp_path / "requests.journal"))
+    monkeypatch.setattr(config, "REQUEST_ID_FILE", str(tmp_path / "last_request_id"))
+
+    def start():
+        # Перечитываем модуль: весь кэш в памяти теряется, как при перезапуске
+        import sheets
+
+        sheets = importlib.reload(sheets)
+        sheets.use_workbook(workbook)
+        return sheets
+
+    return start
+
+
+def _create(sheets, count):
+    return [sheets.add_new_request("@demo", "Экспонат", "Проблема") for _ in range(count)]
+
+
+def test_restart_replays_replicated_events_after_snapshot(start_bot, workbook):
+    sheets = start_bot()
+    _create(sheets, 3)
+    assert sheets.sync_journal(snapshot=True) == 3
+    _create(sheets, 3)
+    sheets.get_engineers()
+    assert sheets.try_claim("1", 1, "@eng") is True
+    assert sheets.write_claim("1", 1, "@eng") is True
+    assert sheets.sync_journal() == 4
+
+    sheets = start_bot()
+    reads = workbook.calls.get("get_all_values", 0)
+    assert [r["id"] for r in sheets.get_requests_by_status("Новая")] == ["2", "3", "4", "5", "6"]
+    assert sheets.get_request("1")["Статус"] == "В работе"
+    # Кэш восстановлен из снимка и журнала, без чтения листа
+    assert workbook.calls.get("get_all_values", 0) == reads
+    sheets.get_engineers()
+    assert sheets.try_claim("1", 2, "@other") is False
+
+
+def test_restart_after_compaction_continues_numbering(start_bot, workbook):
+    sheets = start_bot()
+    _create(sheets, 2)
+    sheets.sync_journal()
+    # Снимок после переноса сжимает журнал до пустого файла
+    sheets.sync_journal(snapshot=True)
+
+    sheets = start_bot()
+    assert _create(sheets, 1) == [3]
+    assert sheets.sync_journal() == 1
+    rows = workbook.worksheet(config.SHEET_NAMES["requests"]).get_all_values()
+    assert [row[0] for row in rows[1:]] == ["1", "2", "3"]
@@ -0,0 +1,37 @@
+"""Списки /new и /inprogress: страница помещается в одно сообщение."""
+
+from handlers import engineer, helpers
+
+# Точки экранируются, и в MarkdownV2 текст вырастает вдвое
+LONG_PROBLEM = "Не работает. " * 308
+
+
+def _listing(status):
+    items = []
+    for request_id in range(1, 6):
+        item = engineer._listing_item(
+            {
+                "id": request_id,
+                "Экспонат": "Робот-художник",
+                "demonstrator_username": "@demonstrator",
+                "Проблема": LONG_PROBLEM,
+                "Ответственный": "Инженер",
+                "engineer_username": "@engineer",
+            }
+        )
+        items.append(item)
+    return {"status": status, "owner": "@engineer", "items": items}
+
+
+def test_page_of_long_problems_fits_message():
+    assert len(LONG_PROBLEM) >= 4000
+    for status in ("Новая", "В работе"):
+        text, _ = engineer._render_listing(1, _listing(status), 0)
+        assert len(text) <= 4096
+        assert text.count("…") == engineer.LISTING_PAGE_SIZE
+
+
+def test_escape_truncated_keeps_escapes_whole():
+    text = helpers.escape_truncated("a.b.c.d", 6)
+    assert text == "a\\.b…"
+    assert helpers.escape_truncated("a.b", 10) == "a\\.b"
@@ -0,0 +1,43 @@
+"""История заявок демонстратора: страница помещается в одно сообщение."""
+
+import asyncio
+from types import SimpleNamespace
+
+import constants as c
+from handlers import common
+
+# Худший случай: в MarkdownV2 экранируется каждый символ
+LONG_PROBLEM = "Не работает" + "!" * 4000
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.from_user = SimpleNamespace(username="demonstrator", full_name="D")
+        self.sent = []
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        self.sent.append(text)
+
+
+def test_history_page_of_long_problems_fits_message(monkeypatch):
+    requests = [
+        {"id": str(i), "Статус": "Завершена", "Экспонат": "Робот", "Проблема": LONG_PROBLEM}
+        for i in range(1, 16)
+    ]
+
+    async def get_requests_by_demonstrator(username):
+        return requests
+
+    monkeypatch.setattr(
+        common.sheets_async, "get_requests_by_demonstrator", get_requests_by_demonstrator
+    )
+    query = FakeQuery(f"{c.CB_MY_REQUESTS_PAGE_PREFIX}0")
+    asyncio.run(common.show_my_requests_history(SimpleNamespace(callback_query=query), None))
+
+    [text] = query.sent
+    assert text.count("…") == common.MY_REQUESTS_HISTORY_PAGE_SIZE
+    assert len(text) <= 4096
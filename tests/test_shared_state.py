@@ -0,0 +1,138 @@
+"""Сверка состояния диалогов между репликами через SQLitePersistence."""
+
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+from telegram.ext import CommandHandler
+
+from persistence import SQLitePersistence
+from shared_state import (
+    SharedConversationHandler,
+    drop_expired_conversations,
+    sync_conversations,
+)
+
+KEY = (10, 20)
+
+
+async def noop(update, context):
+    pass
+
+
+def _handler(**kwargs):
+    return SharedConversationHandler(
+        entry_points=[CommandHandler("start", noop)],
+        states={1: [CommandHandler("next", noop)]},
+        fallbacks=[],
+        name="dialog",
+        persistent=True,
+        **kwargs,
+    )
+
+
+def _age(path, seconds):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE conversations SET updated_at = updated_at - ?", (seconds,))
+    conn.close()
+
+
+def _update():
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=KEY[0]),
+        effective_user=SimpleNamespace(id=KEY[1]),
+        callback_query=None,
+    )
+
+
+def test_conversation_read_does_not_wait_for_writer(tmp_path):
+    persistence = SQLitePersistence(str(tmp_path / "bot.sqlite"))
+
+    async def scenario():
+        await persistence.get_conversations("dialog")
+        await persistence.update_conversation("dialog", KEY, 1)
+        # Запись, занятая ожиданием BEGIN IMMEDIATE, держит _lock
+        with persistence._lock:
+            return await asyncio.wait_for(persistence.load_conversation("dialog", KEY), 1)
+
+    state, _ = asyncio.run(scenario())
+    assert state == 1
+
+
+def test_sync_conversations_applies_stored_state(tmp_path):
+    persistence = SQLitePersistence(str(tmp_path / "bot.sqlite"))
+    handler = _handler()
+    context = SimpleNamespace(
+        application=SimpleNamespace(persistence=persistence, handlers={0: [handler]})
+    )
+
+    async def scenario():
+        # Так диалог подключает к хранилищу Application.initialize()
+        await handler._initialize_persistence(context.application)
+        await persistence.update_conversation("dialog", KEY, 1)
+        await sync_conversations(_update(), context)
+        started = handler._conversations.get(KEY)
+        await persistence.update_conversation("dialog", KEY, None)
+        await sync_conversations(_update(), context)
+        return started, handler._conversations.get(KEY)
+
+    assert asyncio.run(scenario()) == (1, None)
+
+
+def test_expired_state_is_not_synced(tmp_path):
+    path = str(tmp_path / "bot.sqlite")
+    persistence = SQLitePersistence(path)
+    handler = _handler(conversation_timeout=1800)
+    context = SimpleNamespace(
+        application=SimpleNamespace(persistence=persistence, handlers={0: [handler]})
+    )
+
+    async def scenario():
+        await handler._initialize_persistence(context.application)
+        await persistence.update_conversation("dialog", KEY, 1)
+        _age(path, 3600)
+        await sync_conversations(_update(), context)
+        return handler._conversations.get(KEY)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_expired_states_are_dropped_on_start(tmp_path):
+    path = str(tmp_path / "bot.sqlite")
+    persistence = SQLitePersistence(path)
+    handler = _handler(conversation_timeout=1800)
+    application = SimpleNamespace(persistence=persistence, handlers={0: [handler]})
+
+    async def scenario():
+        await persistence.get_conversations("dialog")
+        await persistence.update_conversation("dialog", KEY, 1)
+        await persistence.update_conversation("dialog", (30, 40), 1)
+        _age(path, 3600)
+        await persistence.update_conversation("dialog", (30, 40), 1)
+        # Перезапуск: состояния загружаются из хранилища, таймауты потеряны
+        await handler._initialize_persistence(application)
+        await drop_expired_conversations(application)
+        return await persistence.get_conversations("dialog"), dict(handler._conversations)
+
+    stored, local = asyncio.run(scenario())
+    assert stored == {(30, 40): 1}
+    assert local == {(30, 40): 1}
+
+
+def test_conversations_table_is_migrated(tmp_path):
+    path = str(tmp_path / "bot.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE conversations (name TEXT NOT NULL, key TEXT NOT NULL, "
+        "state BLOB NOT NULL, PRIMARY KEY (name, key))"
+    )
+    conn.close()
+    persistence = SQLitePersistence(path)
+
+    async def scenario():
+        await persistence.update_conversation("dialog", KEY, 1)
+        return await persistence.load_conversation("dialog", KEY)
+
+    state, updated_at = asyncio.run(scenario())
+    assert state == 1 and updated_at is not None
@@ -0,0 +1,41 @@
+"""Фасад sheets_async: таймаут прерывает чтения, но не записи."""
+
+import asyncio
+import time
+
+import pytest
+
+import sheets_async
+
+
+@pytest.fixture
+def short_timeout(monkeypatch):
+    monkeypatch.setitem(sheets_async.run.__kwdefaults__, "timeout", 0.01)
+
+
+def slow(result):
+    def func(*args, **kwargs):
+        time.sleep(0.1)
+        return result
+
+    return func
+
+
+def test_read_times_out(monkeypatch, short_timeout):
+    monkeypatch.setattr(sheets_async.sheets, "get_requests_by_status", slow(["1"]))
+    assert asyncio.run(sheets_async.get_requests_by_status("Новая")) == []
+
+
+def test_writes_wait_for_result(monkeypatch, short_timeout):
+    monkeypatch.setattr(sheets_async.sheets, "add_new_request", slow("7"))
+    monkeypatch.setattr(sheets_async.sheets, "update_request_status", slow(True))
+    monkeypatch.setattr(sheets_async.sheets, "write_claim", slow(True))
+
+    async def scenario():
+        return (
+            await sheets_async.add_new_request("@d", "X", "P"),
+            await sheets_async.update_request_status("7", "Завершена"),
+            await sheets_async.write_claim("7", 1, "@e"),
+        )
+
+    assert asyncio.run(scenario()) == ("7", True, True)
@@ -0,0 +1,30 @@
+"""FakeBackend: переподключение открывает ту же книгу."""
+
+import copy
+
+import requests
+
+import config
+import sheets_backend
+from sheets_backend import DEFAULT_FAKE_SHEETS, FakeBackend
+from sheets_connection import SheetsConnection
+
+REQUESTS = config.SHEET_NAMES["requests"]
+
+
+def test_reconnect_keeps_fake_data():
+    backend = FakeBackend(copy.deepcopy(DEFAULT_FAKE_SHEETS))
+    connection = SheetsConnection(lambda: backend, lambda book: book, 1.0)
+    connection.worksheet(REQUESTS).append_row(["1"])
+
+    connection.report_error(requests.exceptions.ConnectionError())
+    assert not connection.is_connected
+
+    assert connection.workbook() is backend.open()
+    assert connection.worksheet(REQUESTS).get_all_values()[-1][0] == "1"
+
+
+def test_get_backend_returns_one_fake_backend(monkeypatch):
+    monkeypatch.setattr(sheets_backend, "SHEETS_BACKEND", "fake")
+    monkeypatch.setattr(sheets_backend, "_fake_backend", None)
+    assert sheets_backend.get_backend() is sheets_backend.get_backend()